@@ -0,0 +1,624 @@
+"""
+A local stand-in for the parts of the Canvas REST API the scripts use, for
+benchmarking them offline and reproducibly.
+
+It serves one course with paginated assignments, assignment groups, group
+sets, sections and submissions (with comments and attachments of a
+configurable size and count), accepts assignment creation, edits and
+deletion, section overrides (batch creation and deletion), bulk date
+updates and grading or commenting on a submission, and serves the
+attachments themselves with Range support. Every response can be delayed
+by a fixed latency, page sizes can be capped to force deep pagination, and
+a leaky bucket reproduces Canvas's `X-Rate-Limit-Remaining`/`X-Request-Cost`
+headers and 403 throttling.
+
+Counters are exposed at GET /__stats and reset, along with the course data,
+by POST /__reset. Run it on its own with:
+
+    python bench/fake_canvas.py --port 8765
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlparse
+
+COURSE_ID = 1
+ASSIGNMENT_GROUP_ID = 10
+GROUP_CATEGORY_ID = 20
+SECTION_IDS = (30, 31)
+USER_ID_BASE = 5000
+
+# When the first student hands in and is graded: 2023-01-30 and 2023-02-01, noon UTC
+SUBMITTED_AT = 1675080000
+GRADED_AT = 1675252800
+
+# Canvas's bucket holds 700 units of quota
+BUCKET_CAPACITY = 700.0
+
+# File bodies are written in pieces of this size, so big attachments don't
+# have to be built in memory
+_WRITE_CHUNK = 64 * 1024
+
+
+class FakeCanvasConfig:
+    """
+    The shape and behaviour of the fake course.
+
+    Args:
+        assignments (int): Number of "Homework N" assignments.
+        submissions (int): Students, and so submissions per assignment.
+        attachments (int): Attachments per submission with files.
+        attachment_size (int): Size of a submission's first attachment in
+            bytes. The k-th is 1/k of it, like a report and its smaller extras.
+        comments (int): Comments per submission.
+        latency (float): Seconds added to every response.
+        max_per_page (int): Cap on per_page, to force deeper pagination.
+        request_cost (float): Quota each request costs; 0 never throttles.
+        refill_rate (float): Quota the bucket regains per second.
+        seed (int): Seed for the generated scores.
+    """
+
+    def __init__(self, assignments=40, submissions=120, attachments=1, attachment_size=512 * 1024,
+                 comments=2, latency=0.05, max_per_page=100, request_cost=0.0, refill_rate=10.0,
+                 seed=1):
+        self.assignments = assignments
+        self.submissions = submissions
+        self.attachments = attachments
+        self.attachment_size = attachment_size
+        self.comments = comments
+        self.latency = latency
+        self.max_per_page = max_per_page
+        self.request_cost = request_cost
+        self.refill_rate = refill_rate
+        self.seed = seed
+
+
+class FakeCanvas:
+    """
+    The fake course's data and counters. Thread-safe.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            rnd = random.Random(self.config.seed)
+            self.assignments = []
+            self.submissions = {}
+            self.files = {}
+            self.progress = {}
+            self._next_override_id = 1
+            for n in range(1, self.config.assignments + 1):
+                self._add_assignment({"name": f"Homework {n}", "points_possible": 30,
+                                      "assignment_group_id": ASSIGNMENT_GROUP_ID}, rnd)
+            self.requests = 0
+            self.bytes_sent = 0
+            self.throttled = 0
+            self.endpoints = {}
+            self._bucket = BUCKET_CAPACITY
+            self._bucket_time = time.monotonic()
+
+    def create_assignment(self, attributes):
+        with self._lock:
+            return self._add_assignment(attributes, None)
+
+    def update_assignment(self, assignment_id, attributes):
+        with self._lock:
+            assignment = self._assignment(assignment_id)
+            if assignment is not None:
+                assignment.update(self._normalize(attributes))
+                assignment["updated_at"] = _now()
+            return assignment
+
+    def delete_assignment(self, assignment_id):
+        with self._lock:
+            assignment = self._assignment(assignment_id)
+            if assignment is not None:
+                self.assignments.remove(assignment)
+            return assignment
+
+    def add_overrides(self, overrides):
+        with self._lock:
+            created = []
+            for attributes in overrides:
+                assignment = self._assignment(attributes.get("assignment_id"))
+                if assignment is None:
+                    return None
+                section_id = int(attributes["course_section_id"])
+                override = {"id": self._next_override_id, "assignment_id": assignment["id"],
+                            "course_section_id": section_id,
+                            "title": f"Section {SECTION_IDS.index(section_id) + 1}"}
+                override.update(self._normalize({field: value for field, value in attributes.items()
+                                                 if field in ("due_at", "unlock_at", "lock_at")}))
+                self._next_override_id += 1
+                assignment["overrides"].append(override)
+                created.append(override)
+            return created
+
+    def delete_override(self, assignment_id, override_id):
+        with self._lock:
+            assignment = self._assignment(assignment_id)
+            for override in assignment["overrides"] if assignment is not None else []:
+                if override["id"] == int(override_id):
+                    assignment["overrides"].remove(override)
+                    return override
+            return None
+
+    def bulk_update_dates(self, entries):
+        # Applied at once and reported as an already completed Progress
+        with self._lock:
+            for entry in entries:
+                assignment = self._assignment(entry["id"])
+                if assignment is None:
+                    continue
+                for dates in entry["all_dates"]:
+                    if dates.get("base"):
+                        target = assignment
+                    else:
+                        target = next((o for o in assignment["overrides"] if o["id"] == dates.get("id")), None)
+                    if target is not None:
+                        target.update({field: dates.get(field) for field in ("due_at", "unlock_at", "lock_at")})
+                assignment["updated_at"] = _now()
+            progress_id = len(self.progress) + 1
+            self.progress[progress_id] = {"id": progress_id, "workflow_state": "completed", "completion": 100,
+                                          "tag": "assignment_bulk_update",
+                                          "url": f"{{host}}/api/v1/progress/{progress_id}"}
+            return self.progress[progress_id]
+
+    def grade_submission(self, assignment_id, user_id, grade, comment):
+        with self._lock:
+            for submission in self.submissions.get(int(assignment_id), []):
+                if submission["user_id"] == int(user_id):
+                    now = _now()
+                    if grade is not None:
+                        submission.update(score=float(grade), workflow_state="graded", graded_at=now)
+                        self._assignment(assignment_id)["graded_submissions_exist"] = True
+                    if comment:
+                        submission["submission_comments"].append(
+                            {"id": submission["id"] * 10 + len(submission["submission_comments"]),
+                             "author_name": "Grader", "created_at": now, "comment": comment})
+                    return submission
+            return None
+
+    def _assignment(self, assignment_id):
+        try:
+            assignment_id = int(assignment_id)
+        except (TypeError, ValueError):
+            return None
+        return next((a for a in self.assignments if a["id"] == assignment_id), None)
+
+    def _normalize(self, attributes):
+        # Form values arrive as strings, and an empty one clears a field
+        attributes = {field: None if value == "" else value for field, value in attributes.items()}
+        for field, convert in (("points_possible", float), ("assignment_group_id", int),
+                               ("group_category_id", int), ("allowed_attempts", int), ("position", int)):
+            if attributes.get(field) is not None:
+                attributes[field] = convert(attributes[field])
+        if "published" in attributes:
+            attributes["published"] = attributes["published"] in (True, "true")
+        attributes.pop("notify_of_update", None)
+        return attributes
+
+    def _add_assignment(self, attributes, rnd):
+        assignment_id = 100 + len(self.submissions) + 1
+        assignment = {"due_at": None, "unlock_at": None, "lock_at": None, "published": False}
+        assignment.update(self._normalize(attributes))
+        assignment.update({
+            "id": assignment_id,
+            "course_id": COURSE_ID,
+            "points_possible": assignment.get("points_possible") or 0.0,
+            "assignment_group_id": assignment.get("assignment_group_id") or ASSIGNMENT_GROUP_ID,
+            "has_submitted_submissions": rnd is not None,
+            "graded_submissions_exist": rnd is not None,
+            "overrides": [],
+            "updated_at": "2023-01-01T00:00:00Z",
+        })
+        if assignment.get("position") is None:
+            # Like Canvas, a new assignment goes to the bottom of its group
+            assignment["position"] = 1 + max((a["position"] for a in self.assignments
+                                              if a["assignment_group_id"] == assignment["assignment_group_id"]),
+                                             default=0)
+        self.assignments.append(assignment)
+        self.submissions[assignment_id] = [] if rnd is None else self._make_submissions(assignment, rnd)
+        return assignment
+
+    def _make_submissions(self, assignment, rnd):
+        config = self.config
+        submissions = []
+        for n in range(config.submissions):
+            submission_id = assignment["id"] * 10000 + n
+            # Some students never hand anything in, and some aren't graded yet.
+            # They hand in and are graded a minute apart, as in a real course.
+            submitted = n % 10 != 9
+            graded = submitted and n % 8 != 7
+            submitted_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(SUBMITTED_AT + 60 * n))
+            graded_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(GRADED_AT + 60 * n))
+            attachments = []
+            if submitted:
+                for k in range(config.attachments):
+                    file_id = submission_id * 10 + k
+                    size = config.attachment_size // (k + 1)
+                    self.files[file_id] = size
+                    attachments.append({
+                        "id": file_id,
+                        "filename": f"submission_{n}_{k}.pdf",
+                        "display_name": f"submission_{n}_{k}.pdf",
+                        "content-type": "application/pdf",
+                        "size": size,
+                        "url": f"{{host}}/files/{file_id}/download",
+                        "updated_at": "2023-01-30T12:00:00Z",
+                    })
+            submissions.append({
+                "id": submission_id,
+                "user_id": USER_ID_BASE + n,
+                "assignment_id": assignment["id"],
+                "attempt": 1 if submitted else None,
+                "score": float(rnd.randint(0, 30)) if graded else None,
+                "workflow_state": "graded" if graded else ("submitted" if submitted else "unsubmitted"),
+                "submitted_at": submitted_at if submitted else None,
+                "graded_at": graded_at if graded else None,
+                "attachments": attachments,
+                "submission_comments": [
+                    {"id": submission_id * 10 + c, "author_name": "Grader",
+                     "created_at": "2023-02-01T12:00:00Z",
+                     "comment": f"Comment {c + 1} on submission {submission_id}."}
+                    for c in range(config.comments if graded else 0)
+                ],
+                "user": {"id": USER_ID_BASE + n, "name": f"Student {n}", "sortable_name": f"{n}, Student"},
+            })
+        return submissions
+
+    def charge(self, endpoint):
+        """
+        Counts a request and takes its cost out of the bucket.
+
+        Returns:
+            float: The quota left, negative if the request is throttled.
+        """
+        with self._lock:
+            self.requests += 1
+            self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+            now = time.monotonic()
+            self._bucket = min(BUCKET_CAPACITY,
+                               self._bucket + (now - self._bucket_time) * self.config.refill_rate)
+            self._bucket_time = now
+            if self._bucket < 0:
+                self.throttled += 1
+                return self._bucket
+            self._bucket -= self.config.request_cost
+            return self._bucket
+
+    def count_bytes(self, n):
+        with self._lock:
+            self.bytes_sent += n
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "bytes_sent": self.bytes_sent,
+                    "throttled": self.throttled, "endpoints": dict(self.endpoints)}
+
+
+class FakeCanvasHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    canvas = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            self.json_body = json.loads(body)
+            self.form_items = []
+        else:
+            self.json_body = None
+            self.form_items = parse_qsl(body, keep_blank_values=True)
+
+        if url.path == "/__stats":
+            return self._send_json(self.canvas.stats(), charge=False)
+        if url.path == "/__reset":
+            self.canvas.reset()
+            return self._send_json({}, charge=False)
+
+        time.sleep(self.canvas.config.latency)
+        for route_method, pattern, handler in _ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                self.endpoint = f"{method} {pattern}"
+                return handler(self, *match.groups())
+        self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+
+    # --- routes ---
+
+    def current_user(self):
+        self._send_json({"id": 1, "name": "Benchmark Teacher"})
+
+    def get_course(self, course_id):
+        if int(course_id) != COURSE_ID:
+            return self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+        self._send_json({"id": COURSE_ID, "name": "Benchmark 101", "course_code": "BENCH 101"})
+
+    def list_assignments(self, course_id):
+        include = set(self.query.get("include[]", []))
+        assignments = [a if "overrides" in include else {k: v for k, v in a.items() if k != "overrides"}
+                       for a in self.canvas.assignments]
+        assignments.sort(key=lambda a: (a["assignment_group_id"], a["position"], a["id"]))
+        self._send_page(assignments)
+
+    def create_assignment(self, course_id):
+        self._send_json(self.canvas.create_assignment(self._form_object("assignment")))
+
+    def update_assignment(self, course_id, assignment_id):
+        self._send_or_404(self.canvas.update_assignment(assignment_id, self._form_object("assignment")))
+
+    def delete_assignment(self, course_id, assignment_id):
+        self._send_or_404(self.canvas.delete_assignment(assignment_id))
+
+    def create_overrides(self, course_id):
+        # Rails starts the next object of an array whenever a field repeats
+        overrides = []
+        for key, value in self.form_items:
+            if key.startswith("assignment_overrides[]["):
+                field = key[len("assignment_overrides[]["):-1]
+                if not overrides or field in overrides[-1]:
+                    overrides.append({})
+                overrides[-1][field] = value
+        created = self.canvas.add_overrides(overrides)
+        if created is None:
+            return self._send_error(400, {"errors": [{"message": "unknown assignment"}]})
+        self._send_json(created)
+
+    def delete_override(self, course_id, assignment_id, override_id):
+        self._send_or_404(self.canvas.delete_override(assignment_id, override_id))
+
+    def bulk_update(self, course_id):
+        if not isinstance(self.json_body, list):
+            return self._send_error(400, {"errors": [{"message": "expected a JSON array"}]})
+        self._send_json(self.canvas.bulk_update_dates(self.json_body))
+
+    def get_progress(self, progress_id):
+        self._send_or_404(self.canvas.progress.get(int(progress_id)))
+
+    def list_assignment_groups(self, course_id):
+        self._send_page([{"id": ASSIGNMENT_GROUP_ID, "name": "Labs", "position": 1}])
+
+    def list_group_categories(self, course_id):
+        self._send_page([{"id": GROUP_CATEGORY_ID, "name": "Teams"}])
+
+    def list_sections(self, course_id):
+        self._send_page([{"id": section_id, "name": f"Section {i + 1}", "course_id": COURSE_ID}
+                         for i, section_id in enumerate(SECTION_IDS)])
+
+    def list_assignment_submissions(self, course_id, assignment_id):
+        self._send_page(self._render(self.canvas.submissions.get(int(assignment_id), [])))
+
+    def grade_submission(self, course_id, assignment_id, user_id):
+        form = dict(self.form_items)
+        submission = self.canvas.grade_submission(assignment_id, user_id, form.get("submission[posted_grade]"),
+                                                  form.get("comment[text_comment]"))
+        if submission is None:
+            return self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+        self._send_json(self._render([submission])[0])
+
+    def get_submission(self, course_id, assignment_id, user_id):
+        for submission in self.canvas.submissions.get(int(assignment_id), []):
+            if submission["user_id"] == int(user_id):
+                return self._send_json(self._render([submission])[0])
+        self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+
+    def list_student_submissions(self, course_id):
+        q = self.query
+        assignment_ids = {int(a) for a in q.get("assignment_ids[]", [])}
+        student_ids = q.get("student_ids[]", ["all"])
+        items = [s for a in self.canvas.assignments
+                 if not assignment_ids or a["id"] in assignment_ids
+                 for s in self.canvas.submissions[a["id"]]]
+        if student_ids != ["all"]:
+            wanted = {int(u) for u in student_ids}
+            items = [s for s in items if s["user_id"] in wanted]
+        if "workflow_state" in q:
+            items = [s for s in items if s["workflow_state"] == q["workflow_state"][0]]
+        for field, param in (("graded_at", "graded_since"), ("submitted_at", "submitted_since")):
+            if param in q:
+                since = q[param][0].replace("+00:00", "Z")
+                items = [s for s in items if s[field] is not None and s[field] > since]
+        self._send_page(self._render(items))
+
+    def download_file(self, file_id):
+        size = self.canvas.files.get(int(file_id))
+        if size is None:
+            return self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        piece = bytes([int(file_id) % 256]) * _WRITE_CHUNK
+        left = size - start
+        while left > 0:
+            n = min(left, _WRITE_CHUNK)
+            self.wfile.write(piece[:n])
+            left -= n
+        self.canvas.count_bytes(size - start)
+
+    # --- helpers ---
+
+    def _form_object(self, prefix):
+        # Rails-style prefix[field] and prefix[field][] (list) form fields
+        obj = {}
+        for key, value in self.form_items:
+            if key.startswith(prefix + "["):
+                field = key[len(prefix) + 1:].split("]")[0]
+                if key.endswith("[]"):
+                    obj.setdefault(field, []).append(value)
+                else:
+                    obj[field] = value
+        return obj
+
+    def _send_or_404(self, data):
+        if data is None:
+            return self._send_error(404, {"errors": [{"message": "The specified resource does not exist."}]})
+        self._send_json(data)
+
+    def _render(self, submissions):
+        # Leaves out what the request didn't ask to include, like Canvas does
+        include = set(self.query.get("include[]", []))
+        rendered = []
+        for submission in submissions:
+            submission = dict(submission)
+            if "user" not in include:
+                del submission["user"]
+            if "submission_comments" not in include:
+                del submission["submission_comments"]
+            rendered.append(submission)
+        return rendered
+
+    def _host(self):
+        return f"http://{self.headers['Host']}"
+
+    def _send_page(self, items):
+        per_page = min(int(self.query.get("per_page", ["10"])[0]), self.canvas.config.max_per_page)
+        page = int(self.query.get("page", ["1"])[0])
+        last = max(1, -(-len(items) // per_page))
+        base = self._host() + urlparse(self.path).path
+        params = [(k, v) for k, values in self.query.items() if k != "page" for v in values]
+
+        def link(n):
+            return base + "?" + urlencode(params + [("page", n)])
+
+        links = {"current": link(page), "first": link(1), "last": link(last)}
+        if page < last:
+            links["next"] = link(page + 1)
+        if page > 1:
+            links["prev"] = link(page - 1)
+        header = ",".join(f'<{url}>; rel="{rel}"' for rel, url in links.items())
+        self._send_json(items[(page - 1) * per_page:page * per_page], {"Link": header})
+
+    def _send_json(self, data, headers=None, charge=True):
+        status = 200
+        if charge:
+            remaining = self.canvas.charge(self.endpoint)
+            if remaining < 0:
+                return self._send_throttled()
+            headers = dict(headers or {})
+            headers["X-Rate-Limit-Remaining"] = f"{remaining:.1f}"
+            headers["X-Request-Cost"] = f"{self.canvas.config.request_cost:.1f}"
+        body = json.dumps(data).replace("{host}", self._host()).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.canvas.count_bytes(len(body))
+
+    def _send_throttled(self):
+        body = b"403 Forbidden (Rate Limit Exceeded)"
+        self.send_response(403)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Rate-Limit-Remaining", "0.0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_C = r"/api/v1/courses/(\d+)"
+_ROUTES = [
+    ("GET", r"/api/v1/users/self", FakeCanvasHandler.current_user),
+    ("GET", _C, FakeCanvasHandler.get_course),
+    ("GET", _C + r"/assignments", FakeCanvasHandler.list_assignments),
+    ("POST", _C + r"/assignments", FakeCanvasHandler.create_assignment),
+    ("POST", _C + r"/assignments/overrides", FakeCanvasHandler.create_overrides),
+    ("PUT", _C + r"/assignments/bulk_update", FakeCanvasHandler.bulk_update),
+    ("PUT", _C + r"/assignments/(\d+)", FakeCanvasHandler.update_assignment),
+    ("DELETE", _C + r"/assignments/(\d+)", FakeCanvasHandler.delete_assignment),
+    ("DELETE", _C + r"/assignments/(\d+)/overrides/(\d+)", FakeCanvasHandler.delete_override),
+    ("GET", _C + r"/assignment_groups", FakeCanvasHandler.list_assignment_groups),
+    ("GET", _C + r"/group_categories", FakeCanvasHandler.list_group_categories),
+    ("GET", _C + r"/sections", FakeCanvasHandler.list_sections),
+    ("GET", _C + r"/assignments/(\d+)/submissions", FakeCanvasHandler.list_assignment_submissions),
+    ("GET", _C + r"/assignments/(\d+)/submissions/(\d+)", FakeCanvasHandler.get_submission),
+    ("PUT", _C + r"/assignments/(\d+)/submissions/(\d+)", FakeCanvasHandler.grade_submission),
+    ("GET", _C + r"/students/submissions", FakeCanvasHandler.list_student_submissions),
+    ("GET", r"/files/(\d+)/download", FakeCanvasHandler.download_file),
+    ("GET", r"/api/v1/progress/(\d+)", FakeCanvasHandler.get_progress),
+]
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def make_server(config, port=0):
+    """
+    Returns a ThreadingHTTPServer serving a fake course on localhost. Call
+    serve_forever() on it (e.g. from a thread) to start it.
+    """
+    handler = type("Handler", (FakeCanvasHandler,), {"canvas": FakeCanvas(config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_config_arguments(parser):
+    """
+    Adds a command line option for every FakeCanvasConfig setting.
+    """
+    defaults = FakeCanvasConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+
+
+def config_from_args(args):
+    return FakeCanvasConfig(**{name: getattr(args, name) for name in vars(FakeCanvasConfig())})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(config_from_args(args), args.port)
+    print(f"Fake Canvas serving course {COURSE_ID} at http://127.0.0.1:{server.server_port}")
+    server.serve_forever()
@@ -0,0 +1,212 @@
+"""
+Benchmarks the scripts against a local fake Canvas (see fake_canvas.py).
+
+Each scenario runs the real code path, studentwork.py's
+download_submission_examples or the assignment creation in canvas/, in a
+fresh child process pointed at the fake, and reports its wall time, the
+requests it made, the bytes the fake served and the child's peak RSS:
+
+    python bench/run_bench.py
+    python bench/run_bench.py --scenarios download_cold download_warm --latency 0.1
+    python bench/run_bench.py --repeat 3 --json results.json
+
+download_cold, create_labs and schedule_apply start from a fresh course and
+working directory. The scenarios after each of them reuse the download directory,
+listing cache and course state it left behind, so "warm" and "rerun" measure
+what a second run of the same script costs. download_zip skips the blob store,
+so it streams every attachment from the fake into the archive again.
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import warnings
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_canvas  # noqa: E402
+
+# name: whether the course and working directory start fresh
+SCENARIOS = {
+    "download_cold": True,
+    "download_warm": False,
+    "download_zip": False,
+    "download_watch": False,
+    "create_labs": True,
+    "create_exercises": False,
+    "create_rerun": False,
+    "schedule_apply": True,
+    "schedule_shift": False,
+}
+
+# Checks for grading changes made by download_watch
+WATCH_POLLS = 3
+
+
+def run_scenario(name, url, workdir):
+    """
+    Runs one scenario in this process. Called in the child.
+    """
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, os.path.join(REPO_DIR, "canvas"))
+    # The fake is plain http on localhost, which canvasapi warns about
+    warnings.simplefilter("ignore")
+
+    from listing_cache import ListingCache
+    from ratelimit import connect
+
+    canvas = connect(url, "benchmark-token")
+    cache = ListingCache(os.path.join(workdir, "cache.sqlite"))
+
+    if name.startswith("download"):
+        import studentwork
+        from catalog import CourseCatalog
+        studentwork.BLOB_STORE = os.path.join(workdir, "blobs")
+        studentwork.DOWNLOAD_DIR = os.path.join(workdir, "downloads")
+        if name == "download_zip":
+            # Without the blob store every attachment is streamed from the
+            # fake into the archive, instead of copied from download_cold's
+            studentwork.BLOB_STORE = ""
+            studentwork.OUTPUT_ARCHIVE = os.path.join(workdir, "samples.zip")
+        names = [a.name for a in CourseCatalog.load(canvas, fake_canvas.COURSE_ID, cache).assignments]
+        if name == "download_watch":
+            # A warm run followed by WATCH_POLLS checks that find nothing new
+            studentwork.download_submission_examples(canvas, fake_canvas.COURSE_ID, names, cache,
+                                                     watch_interval=0, watch_polls=WATCH_POLLS)
+            return
+        studentwork.download_submission_examples(canvas, fake_canvas.COURSE_ID, names, cache)
+        return
+
+    from bulk_create import create_assignments
+    from catalog import CourseCatalog
+    from generate_exercise_assignments import dates, exercise_specs
+    from make_labs import lab_specs
+
+    catalog = CourseCatalog.load(canvas, fake_canvas.COURSE_ID, cache)
+    if name.startswith("schedule"):
+        from schedule import apply_plan, load_schedule, plan_changes, write_schedule
+        specs = lab_specs(None)
+        for num, mo, da in dates:
+            specs += exercise_specs(num, mo, da, None, None, ["Section 2"])
+        if name == "schedule_shift":
+            # every date of the term, overrides included, a day later
+            for spec in specs:
+                for dated in [spec] + spec.get("overrides", []):
+                    for field in ("due_at", "unlock_at", "lock_at"):
+                        if dated.get(field) is not None:
+                            dated[field] += timedelta(days=1)
+        path = os.path.join(workdir, "schedule.json")
+        write_schedule(path, specs, "America/Los_Angeles", assignment_group="Labs", group_set="Teams")
+        apply_plan(catalog, plan_changes(catalog, load_schedule(path, catalog)))
+        return
+
+    group_id = catalog.assignment_groups.id("Labs")
+    specs = []
+    if name in ("create_labs", "create_rerun"):
+        specs += lab_specs(group_id)
+    if name in ("create_exercises", "create_rerun"):
+        groupset_id = catalog.group_categories.id("Teams")
+        for num, mo, da in dates:
+            specs += exercise_specs(num, mo, da, group_id, groupset_id)
+    create_assignments(catalog, specs)
+
+
+def child_main(name, url, workdir, verbose):
+    output = sys.stdout if verbose else open(os.devnull, "w")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run_scenario(name, url, workdir)
+    wall = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    print(json.dumps({"wall": wall, "peak_rss_mb": rss_mb}))
+
+
+def fake_request(url, path, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url + path, method=method)) as response:
+        return json.load(response)
+
+
+def run_child(name, url, workdir, verbose):
+    """
+    Runs a scenario in a child process and returns its measurements,
+    including what the fake saw of it.
+    """
+    before = fake_request(url, "/__stats")
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--url", url, "--workdir", workdir]
+    if verbose:
+        command.append("--verbose")
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if verbose:
+        print(result.stdout, end="")
+    if result.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed with exit code {result.returncode}")
+    after = fake_request(url, "/__stats")
+
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured["requests"] = after["requests"] - before["requests"]
+    measured["throttled"] = after["throttled"] - before["throttled"]
+    measured["mb_served"] = (after["bytes_sent"] - before["bytes_sent"]) / (1024 * 1024)
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario; the median is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    fake_canvas.add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.child, args.url, args.workdir, args.verbose)
+        return
+
+    server = fake_canvas.make_server(fake_canvas.config_from_args(args))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    runs = {name: [] for name in args.scenarios}
+    for _ in range(args.repeat):
+        workdir = None
+        for name in args.scenarios:
+            if SCENARIOS[name] or workdir is None:
+                if workdir is not None:
+                    shutil.rmtree(workdir)
+                workdir = tempfile.mkdtemp(prefix="canvas-bench-")
+                fake_request(url, "/__reset", method="POST")
+            runs[name].append(run_child(name, url, workdir, args.verbose))
+        shutil.rmtree(workdir)
+    server.shutdown()
+
+    results = {name: {key: statistics.median(run[key] for run in measured) for key in measured[0]}
+               for name, measured in runs.items()}
+    print(f"{'scenario':<18}{'wall s':>9}{'requests':>10}{'throttled':>11}{'MB served':>11}{'peak RSS MB':>13}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['wall']:>9.2f}{r['requests']:>10.0f}{r['throttled']:>11.0f}"
+              f"{r['mb_served']:>11.1f}{r['peak_rss_mb']:>13.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(fake_canvas.config_from_args(args)), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
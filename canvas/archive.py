@@ -0,0 +1,362 @@
+"""
+Writes downloaded samples and their reports straight into a single archive
+instead of a folder tree.
+
+Worker threads hand entries to the archive, either whole (`add`, for small
+ones like the comment reports) or chunk by chunk as they download (`open`),
+and a background thread compresses and writes them one after another, so
+compression overlaps with the transfers still in progress. Streamed entries
+that are still waiting for their turn are spooled, in memory up to
+SPOOL_MEMORY bytes each and then to a temporary file next to the archive, so
+every download keeps going while the writer works on another one. The entry
+being written is handed over through a short bounded queue instead, and the
+queue of entries is bounded too, so downloads wait instead of piling up if
+compression falls behind.
+
+Entries are written whole, one at a time, so a streamed entry that can't be
+completed (its download failed) can't be taken back out. In a zip, it is
+dropped from the central directory and no reader sees it. A .tar.zst is
+written front to back, so there the rest of the entry is zero-filled and an
+empty "<name>.incomplete" entry is added after it.
+The archive is written under a temporary name and renamed into place once it
+is complete, so an interrupted run never leaves a truncated archive behind.
+
+Supported formats, by extension:
+- .zip, deflated (entries in already-compressed formats are stored as is)
+- .tar.zst, which needs the zstandard package
+"""
+import io
+import os
+import queue
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Entries waiting to be compressed before `add` and `open` block
+DEFAULT_MAX_PENDING = 8
+
+# Chunks of the streamed entry being written that may wait before `write` blocks
+DEFAULT_STREAM_CHUNKS = 2
+
+# Bytes of a streamed entry kept in memory while it waits for its turn; the
+# rest goes to a temporary file
+SPOOL_MEMORY = 1024 * 1024
+SPOOL_READ_SIZE = 1024 * 1024
+
+ZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# Deflating these again costs time and saves next to nothing
+STORED_EXTENSIONS = (".zip", ".gz", ".png", ".jpg", ".jpeg", ".gif", ".mp4", ".mov", ".docx", ".pptx", ".xlsx")
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar.zst")
+
+_DONE = object()
+
+# What ends a streamed entry's chunks: complete, or cut short
+_END = object()
+_ABORT = object()
+
+
+class ArchiveWriter:
+    """
+    An archive that entries are added to from any thread. Use it as a
+    context manager: leaving the block normally completes the archive, and
+    leaving it with an exception discards it.
+
+    Args:
+        path (str): The archive to write, ending in .zip or .tar.zst.
+        max_pending (int): Entries that may wait for the writer thread.
+        stream_chunks (int): Chunks of the streamed entry being written that
+            may wait for the writer thread.
+
+    Raises:
+        ValueError: If the format isn't supported or zstandard is missing.
+    """
+
+    def __init__(self, path, max_pending=DEFAULT_MAX_PENDING, stream_chunks=DEFAULT_STREAM_CHUNKS):
+        if not path.endswith(ARCHIVE_EXTENSIONS):
+            raise ValueError(f"Archive '{path}' must end in one of: {', '.join(ARCHIVE_EXTENSIONS)}")
+        if path.endswith(".tar.zst") and zstandard is None:
+            raise ValueError("Writing .tar.zst archives needs the zstandard package (pip install zstandard)")
+        self.path = path
+        self.entries = 0
+        self.bytes_in = 0
+        self.incomplete = []
+        self.stream_chunks = stream_chunks
+        self._tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.part")
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_all, name="archive-writer", daemon=True)
+
+    def __enter__(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._queue.put(_DONE)
+        self._thread.join()
+        if exc_type is None and self._error is None:
+            os.replace(self._tmp_path, self.path)
+        elif os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        if exc_type is None and self._error is not None:
+            raise self._error
+
+    def add(self, name, data):
+        """
+        Queues an entry to be written. Blocks while the writer is behind.
+
+        Args:
+            name (str): The path inside the archive, with / separators.
+            data (bytes): The entry's contents.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((name, data))
+
+    def open(self, name, size):
+        """
+        Queues an entry whose contents are written to it chunk by chunk, and
+        returns it. Blocks while the writer is behind. Until the writer gets
+        to it, what is written is spooled rather than waiting.
+
+        Args:
+            name (str): The path inside the archive, with / separators.
+            size (int): The entry's size in bytes, which a tar header needs
+                up front.
+
+        Returns:
+            ArchiveEntry: The entry, to use as a context manager: leaving the
+            block normally completes it, and leaving it with an exception
+            cuts it short.
+        """
+        if self._error is not None:
+            raise self._error
+        entry = ArchiveEntry(self, name, size)
+        self._queue.put(entry)
+        return entry
+
+    def _write_all(self):
+        try:
+            if self.path.endswith(".zip"):
+                self._write_zip()
+            else:
+                self._write_tar_zst()
+        except Exception as e:
+            self._error = e
+            # Keep draining, so that nothing blocks on a full queue forever
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, ArchiveEntry):
+                    item._drain()
+
+    def _entries(self):
+        # Yields (name, bytes) for whole entries and (name, ArchiveEntry)
+        # for streamed ones
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            self.entries += 1
+            if isinstance(item, ArchiveEntry):
+                try:
+                    yield item.name, item
+                finally:
+                    # Whatever the writer didn't read (e.g. after an error)
+                    item._drain()
+            else:
+                name, data = item
+                self.bytes_in += len(data)
+                yield name, data
+
+    def _write_zip(self):
+        with zipfile.ZipFile(self._tmp_path, "w") as archive:
+            for name, data in self._entries():
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.compress_type = (zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS)
+                                      else zipfile.ZIP_DEFLATED)
+                if not isinstance(data, ArchiveEntry):
+                    archive.writestr(info, data, compresslevel=ZIP_LEVEL)
+                    continue
+                # What writestr's compresslevel sets; ZipFile.open takes no level
+                info._compresslevel = ZIP_LEVEL
+                with archive.open(info, "w", force_zip64=(data.size or 0) > zipfile.ZIP64_LIMIT) as f:
+                    for chunk in data._chunks_until_end():
+                        f.write(chunk)
+                        self.bytes_in += len(chunk)
+                if data.aborted:
+                    # The bytes stay in the file, but nothing points to them
+                    archive.filelist.remove(archive.NameToInfo.pop(name))
+                    self.incomplete.append(name)
+                    self.entries -= 1
+
+    def _write_tar_zst(self):
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        with open(self._tmp_path, "wb") as f, compressor.stream_writer(f) as stream:
+            with tarfile.open(fileobj=stream, mode="w|") as archive:
+                for name, data in self._entries():
+                    info = tarfile.TarInfo(name)
+                    info.mtime = time.time()
+                    if not isinstance(data, ArchiveEntry):
+                        info.size = len(data)
+                        archive.addfile(info, io.BytesIO(data))
+                        continue
+                    info.size = data.size
+                    reader = _EntryReader(data)
+                    archive.addfile(info, reader)
+                    self.bytes_in += reader.received
+                    if reader.short or reader.left_over() or data._drain():
+                        marker = tarfile.TarInfo(name + ".incomplete")
+                        marker.mtime = info.mtime
+                        archive.addfile(marker)
+                        self.incomplete.append(name)
+                        self.entries -= 1
+
+
+class ArchiveEntry:
+    """
+    An entry being streamed into an archive, from `ArchiveWriter.open`.
+    Its contents are written from one thread while the writer thread
+    compresses them.
+
+    Attributes:
+        aborted (bool): Whether the entry was cut short.
+    """
+
+    def __init__(self, writer, name, size):
+        self.name = name
+        self.size = size
+        self.aborted = False
+        self._writer = writer
+        self._chunks = queue.Queue(writer.stream_chunks)
+        # Until the writer thread takes the entry over, chunks and the end go
+        # to the spool instead of the queue
+        self._lock = threading.Lock()
+        self._spool = None
+        self._spooled_end = None
+        self._streaming = False
+        self._stream = None
+        self._ended = False
+        self._drained = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(aborted=exc_type is not None)
+
+    def write(self, data):
+        """
+        Adds a chunk to the entry. Blocks only while the writer is behind on
+        this entry itself.
+        """
+        if self._writer._error is not None:
+            raise self._writer._error
+        if not data:
+            return
+        with self._lock:
+            if not self._streaming:
+                if self._spool is None:
+                    self._spool = tempfile.SpooledTemporaryFile(
+                        SPOOL_MEMORY, dir=os.path.dirname(self._writer.path) or None)
+                self._spool.write(data)
+                return
+        self._chunks.put(bytes(data))
+
+    def close(self, aborted=False):
+        """
+        Ends the entry, complete or (with aborted) cut short.
+        """
+        if self._ended:
+            return
+        self._ended = True
+        end = _ABORT if aborted else _END
+        with self._lock:
+            if not self._streaming:
+                self._spooled_end = end
+                return
+        self._chunks.put(end)
+
+    def _chunks_until_end(self):
+        # Called on the writer thread. Always the same iterator, so that
+        # `_drain` picks up where the writer stopped reading.
+        if self._stream is None:
+            self._stream = self._read_chunks()
+        return self._stream
+
+    def _read_chunks(self):
+        # First whatever was spooled, then the rest as it is written
+        with self._lock:
+            self._streaming = True
+            spool, end = self._spool, self._spooled_end
+            self._spool = None
+        if spool is not None:
+            with spool:
+                spool.seek(0)
+                while True:
+                    chunk = spool.read(SPOOL_READ_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        while end is None:
+            chunk = self._chunks.get()
+            if chunk is _END or chunk is _ABORT:
+                end = chunk
+            else:
+                yield chunk
+        self.aborted = end is _ABORT
+        self._drained = True
+
+    def _drain(self):
+        # Reads whatever is left up to the end, so the writing thread can
+        # finish. Returns True if anything was left or the entry was cut short.
+        if self._drained:
+            return self.aborted
+        left = False
+        for _ in self._chunks_until_end():
+            left = True
+        return left or self.aborted
+
+
+class _EntryReader:
+    # The file-like object tarfile copies a streamed entry from: exactly
+    # its declared size, zero-filled if the entry was cut short
+    def __init__(self, entry):
+        self.received = 0
+        self.short = False
+        self._chunks = entry._chunks_until_end()
+        self._chunk = b""
+        self._offset = 0
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if self._offset == len(self._chunk):
+                chunk = None if self.short else next(self._chunks, None)
+                if chunk is None:
+                    self.short = True
+                    parts.append(bytes(size))
+                    break
+                self.received += len(chunk)
+                self._chunk, self._offset = chunk, 0
+            piece = self._chunk[self._offset:self._offset + size]
+            self._offset += len(piece)
+            size -= len(piece)
+            parts.append(piece)
+        return b"".join(parts)
+
+    def left_over(self):
+        # Whether the entry turned out longer than its declared size
+        return self._offset < len(self._chunk)
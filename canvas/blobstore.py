@@ -0,0 +1,214 @@
+"""
+A content-addressed store for downloaded attachments, shared by every run and
+every course on this machine.
+
+Each attachment is downloaded once, into a blob named after the SHA-256 of its
+contents, and an index remembers which blob holds which Canvas attachment
+(by id and `updated_at`). The files in a download directory are then hard
+links to their blobs, or reflinks, or as a last resort copies (e.g. when the
+download directory is on another filesystem). A submission sampled into two
+buckets, or sampled again in a later run, costs no extra download and, when
+it can be linked, no extra disk space. Blobs are made read-only, so editing
+a linked file can't change what other links see.
+
+The index also remembers every download directory the store has filled. `gc`
+reads their manifests and deletes the blobs none of them uses any more.
+"""
+import json
+import os
+import shutil
+import threading
+
+from downloads import download_file, partial_path
+from manifest import MANIFEST_NAME
+
+DEFAULT_BLOB_STORE = os.path.expanduser("~/.cache/teaching-tools/blobs")
+
+INDEX_NAME = "index.json"
+
+# The Linux ioctl that makes dst share src's data blocks (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+class BlobStore:
+    """
+    The store in one directory. Safe to share between download worker
+    threads; concurrent requests for the same attachment download it once.
+
+    Args:
+        root (str): The directory holding the blobs and their index.
+    """
+
+    def __init__(self, root=DEFAULT_BLOB_STORE):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._lock = threading.Lock()
+        self._attachment_locks = {}
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        except ValueError:
+            print(f"Warning: ignoring unreadable blob index '{self.index_path}'")
+            index = {}
+        self.attachments = index.get("attachments", {})
+        self.roots = index.get("roots", [])
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    def lookup(self, attachment):
+        """
+        Returns the blob holding this version of an attachment and its
+        SHA-256, or (None, None) if it isn't stored.
+        """
+        with self._lock:
+            entry = self.attachments.get(str(attachment.id))
+        if entry is None or entry["updated_at"] != getattr(attachment, "updated_at", None):
+            return None, None
+        path = self.blob_path(entry["sha256"])
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return None, None
+        except OSError:
+            return None, None
+        return path, entry["sha256"]
+
+    def fetch(self, requester, attachment):
+        """
+        Returns the blob holding an attachment, downloading it first if it
+        isn't stored yet.
+
+        Returns:
+            tuple: (blob path, hex SHA-256, number of bytes downloaded).
+        """
+        with self._lock:
+            attachment_lock = self._attachment_locks.setdefault(attachment.id, threading.Lock())
+        with attachment_lock:
+            path, sha256 = self.lookup(attachment)
+            if path is not None:
+                return path, sha256, 0
+
+            tmp_path = os.path.join(self.root, "tmp", str(attachment.id))
+            downloaded, sha256 = download_file(requester, attachment.url, tmp_path,
+                                               expected_size=getattr(attachment, "size", None),
+                                               tag=attachment.id)
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                # Same bytes as another attachment we already have
+                os.remove(tmp_path)
+            else:
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, path)
+            with self._lock:
+                self.attachments[str(attachment.id)] = {
+                    "sha256": sha256,
+                    "size": os.path.getsize(path),
+                    "updated_at": getattr(attachment, "updated_at", None),
+                }
+                self._save()
+            return path, sha256, downloaded
+
+    def add_root(self, directory):
+        """
+        Remembers a download directory whose manifest references blobs.
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if directory not in self.roots:
+                self.roots.append(directory)
+                self._save()
+
+    def gc(self, dry_run=False):
+        """
+        Deletes every blob that no known download directory's manifest
+        references and that has no other hard links, and forgets download
+        directories that no longer exist.
+
+        Returns:
+            tuple: (number of blobs deleted, bytes freed).
+        """
+        referenced = set()
+        live_roots = []
+        for directory in self.roots:
+            try:
+                with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+                    files = json.load(f)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # Can't tell what it references, so keep everything it might
+                print(f"Warning: unreadable manifest in '{directory}', collecting nothing")
+                return 0, 0
+            live_roots.append(directory)
+            referenced.update(entry.get("sha256") for entry in files.values())
+
+        removed = 0
+        freed = 0
+        blobs_dir = os.path.join(self.root, "blobs")
+        for prefix in os.listdir(blobs_dir) if os.path.isdir(blobs_dir) else []:
+            for sha256 in os.listdir(os.path.join(blobs_dir, prefix)):
+                path = os.path.join(blobs_dir, prefix, sha256)
+                stat = os.stat(path)
+                if sha256 in referenced or stat.st_nlink > 1:
+                    continue
+                removed += 1
+                freed += stat.st_size
+                if not dry_run:
+                    os.remove(path)
+
+        if not dry_run:
+            with self._lock:
+                self.roots = live_roots
+                self.attachments = {key: entry for key, entry in self.attachments.items()
+                                    if os.path.exists(self.blob_path(entry["sha256"]))}
+                self._save()
+        return removed, freed
+
+    def _save(self):
+        # Written to a temporary file and renamed so a crash can't truncate it
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"attachments": self.attachments, "roots": self.roots}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+
+def link_file(src, dst):
+    """
+    Makes dst a hard link to src, or a reflink if hard links aren't possible,
+    or a copy if neither is. Replaces dst atomically.
+
+    Returns:
+        str: "hardlink", "reflink" or "copy".
+    """
+    tmp_path = partial_path(dst, "link")
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        how = "hardlink"
+    except OSError:
+        how = "reflink" if _reflink(src, tmp_path) else "copy"
+        if how == "copy":
+            shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+    return how
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except OSError:
+        # Not supported by this platform or filesystem, or across filesystems
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
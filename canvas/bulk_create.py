@@ -0,0 +1,157 @@
+"""
+Creates many assignments at once, concurrently and idempotently.
+
+An assignment spec is the dict that would be passed to
+`course.create_assignment`. Specs are identified by an idempotency key, the
+assignment's name plus its assignment group, and checked against one fresh
+listing of the course's assignments before anything is created, so running
+a script again only creates what is missing. A spec without an assignment
+group goes wherever Canvas puts it, so it matches by name alone.
+
+Canvas appends each new assignment to the bottom of its group as it is
+created, so concurrent creates would list them in whatever order the
+requests happened to finish. Specs with a group are therefore given the
+`position` their order calls for, and the ones without are created one
+after another.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# How many create requests may be in flight at once
+DEFAULT_CONCURRENCY = 4
+
+
+def idempotency_key(name, assignment_group_id):
+    """
+    Returns the key that identifies an assignment across runs.
+    """
+    return (name, str(assignment_group_id or ""))
+
+
+def index_assignments(assignments):
+    """
+    Maps the idempotency key of each assignment, and its name alone as
+    (name, None), to the first assignment that has it.
+    """
+    index = {}
+    for assignment in assignments:
+        index.setdefault(idempotency_key(assignment.name, getattr(assignment, "assignment_group_id", None)),
+                         assignment)
+        index.setdefault((assignment.name, None), assignment)
+    return index
+
+
+def spec_key(spec):
+    """
+    Returns the key a spec is looked up by in `index_assignments`: its
+    idempotency key, or (name, None) when it names no assignment group,
+    since Canvas then picks the group and always returns one.
+    """
+    if spec.get("assignment_group_id"):
+        return idempotency_key(spec["name"], spec["assignment_group_id"])
+    return (spec["name"], None)
+
+
+def with_positions(specs, assignments):
+    """
+    Returns copies of specs in which each one with an assignment group, and
+    no position of its own, is positioned after the group's assignments and
+    the specs before it.
+
+    Args:
+        specs (list): Assignment dicts, in the order they should be listed.
+        assignments (list): The course's assignments.
+    """
+    bottom = {}
+    for assignment in assignments:
+        group = str(getattr(assignment, "assignment_group_id", None) or "")
+        bottom[group] = max(bottom.get(group, 0), getattr(assignment, "position", None) or 0)
+    positioned = []
+    for spec in specs:
+        if spec.get("assignment_group_id") and spec.get("position") is None:
+            group = str(spec["assignment_group_id"])
+            bottom[group] = bottom.get(group, 0) + 1
+            spec = dict(spec, position=bottom[group])
+        positioned.append(spec)
+    return positioned
+
+
+def creation_batches(specs):
+    """
+    Returns lists of indices into specs that can be created concurrently,
+    each list in order: every positioned spec on its own, and all the others
+    together, since only creating those one after another keeps their order.
+    """
+    batches = [[i] for i, spec in enumerate(specs) if spec.get("position") is not None]
+    unpositioned = [i for i, spec in enumerate(specs) if spec.get("position") is None]
+    if unpositioned:
+        batches.append(unpositioned)
+    return batches
+
+
+def create_assignments(catalog, specs, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Creates every assignment in specs that does not exist yet and prints a
+    line per spec and the total wall time.
+
+    Args:
+        catalog (CourseCatalog): The catalog of the course to create them in.
+        specs (list): Assignment dicts, as accepted by `course.create_assignment`.
+        concurrency (int): The maximum number of create requests in flight.
+
+    Returns:
+        list: One dict per spec with its "name", "status" ("created",
+        "exists" or "failed"), the assignment "id" and any "error".
+    """
+    start = time.perf_counter()
+
+    # One fresh listing stands in for a lookup per spec
+    catalog.reload("assignments")
+    existing = index_assignments(catalog.assignments)
+
+    results = [None] * len(specs)
+    to_create = []
+    claimed = set()
+    for i, spec in enumerate(specs):
+        key = spec_key(spec)
+        if key in existing:
+            results[i] = {"name": spec["name"], "status": "exists", "id": existing[key].id, "error": None}
+        elif key in claimed:
+            results[i] = {"name": spec["name"], "status": "failed", "id": None,
+                          "error": "duplicate of an earlier spec in this batch"}
+        else:
+            claimed.add(key)
+            to_create.append(i)
+
+    def create(spec):
+        try:
+            assignment = catalog.course.create_assignment(spec)
+            return {"name": spec["name"], "status": "created", "id": assignment.id,
+                    "error": None, "assignment": assignment}
+        except Exception as e:
+            return {"name": spec["name"], "status": "failed", "id": None, "error": e}
+
+    if to_create:
+        positioned = with_positions([specs[i] for i in to_create], catalog.assignments)
+        batches = creation_batches(positioned)
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+            for batch, batch_results in zip(batches, pool.map(lambda b: [create(positioned[j]) for j in b],
+                                                              batches)):
+                for j, result in zip(batch, batch_results):
+                    assignment = result.pop("assignment", None)
+                    if assignment is not None:
+                        catalog.assignments.add(assignment)
+                    results[to_create[j]] = result
+        # Anything listing this course's assignments from the cache must see the new ones
+        catalog.forget("assignments")
+
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if result["status"] == "failed":
+            print(f"  {result['name']}: failed ({result['error']})")
+        else:
+            print(f"  {result['name']}: {result['status']} (id {result['id']})")
+    counts = {status: sum(r["status"] == status for r in results) for status in ("created", "exists", "failed")}
+    print(f"{counts['created']} created, {counts['exists']} already existed, "
+          f"{counts['failed']} failed in {elapsed:.1f}s")
+    return results
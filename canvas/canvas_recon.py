@@ -1,4 +1,7 @@
-from canvasapi import Canvas
+
+from catalog import CourseCatalog
+from listing_cache import ListingCache
+from ratelimit import connect
 
 CANVAS_TOKEN_FILE = "" # set this to a file containing your canvas API token
 
@@ -6,13 +9,20 @@ API_URL = "https://wwu.instructure.com/" # set to your institution's canvas url
 API_KEY = open(CANVAS_TOKEN_FILE).read()
 COURSE_ID = "" # set this to your course id (found in the url of the course page)
 
-canvas = Canvas(API_URL, API_KEY)
-course = canvas.get_course(COURSE_ID)
+OFFLINE = False # set to True to print what was cached last time without calling canvas
+
+canvas = connect(API_URL, API_KEY)
+catalog = CourseCatalog.load(canvas, COURSE_ID, ListingCache(offline=OFFLINE))
 
+# the other scripts look these up by name, so this is just for reference
 print("get_assignment_groups")
-for g in course.get_assignment_groups():
+for g in catalog.assignment_groups:
     print('     ', g)
 
 print("get_group_categories")
-for g in course.get_group_categories():
+for g in catalog.group_categories:
     print('    ', g)
+
+print("get_sections")
+for s in catalog.sections:
+    print('    ', s)
@@ -0,0 +1,123 @@
+"""
+An indexed catalog of a course's assignments, assignment groups, group
+categories (group sets) and sections.
+
+Each listing is fetched at most once per run, through the listing cache, and
+indexed by name and by id so that scripts can refer to things by the names
+shown in Canvas instead of IDs copied out of canvas_recon.py output.
+"""
+from functools import cached_property
+
+from canvasapi.assignment import Assignment, AssignmentGroup
+from canvasapi.group import GroupCategory
+from canvasapi.section import Section
+
+from listing_cache import cached_course, cached_list
+
+
+class Index:
+    """
+    Canvas objects of one kind, indexed by id and by name. When several share
+    a name, the first one Canvas listed wins.
+
+    Args:
+        kind (str): What the objects are, for error messages, e.g. "assignment group".
+        objects (iterable): The objects to index.
+    """
+
+    def __init__(self, kind, objects):
+        self.kind = kind
+        self.by_id = {}
+        self.by_name = {}
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj):
+        """
+        Adds an object, e.g. one created after the catalog was loaded.
+        """
+        self.by_id[obj.id] = obj
+        self.by_name.setdefault(obj.name, obj)
+
+    def get(self, name):
+        """
+        Returns the object with the given name, or None.
+        """
+        return self.by_name.get(name)
+
+    def id(self, name):
+        """
+        Returns the id of the object with the given name.
+
+        Raises:
+            LookupError: If there is no such object in the course.
+        """
+        try:
+            return self.by_name[name].id
+        except KeyError:
+            known = ", ".join(repr(n) for n in self.by_name) or "none"
+            raise LookupError(f"No {self.kind} named '{name}' in the course (found: {known})")
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class CourseCatalog:
+    """
+    The catalog of one course. Each index is loaded the first time it is used.
+
+    Args:
+        course (Course): The course to catalog.
+        cache (ListingCache): The cache to read the listings through.
+    """
+
+    def __init__(self, course, cache):
+        self.course = course
+        self.cache = cache
+
+    @classmethod
+    def load(cls, canvas, course_id, cache):
+        """
+        Returns the catalog for course_id, looking the course itself up
+        through the cache too.
+        """
+        return cls(cached_course(canvas, cache, course_id), cache)
+
+    def forget(self, index_name):
+        """
+        Drops the cached listing behind an index (e.g. "assignments") so the
+        next run fetches it again, keeping the index loaded in this run.
+        """
+        self.cache.invalidate_endpoint(f"courses/{self.course.id}/{index_name}")
+
+    def reload(self, index_name):
+        """
+        Drops an index and its cached listing so its next use fetches it
+        from Canvas, e.g. before relying on it to avoid creating duplicates.
+        """
+        self.forget(index_name)
+        self.__dict__.pop(index_name, None)
+
+    @cached_property
+    def assignments(self):
+        return self._load("assignments", "assignment", Assignment)
+
+    @cached_property
+    def assignment_groups(self):
+        return self._load("assignment_groups", "assignment group", AssignmentGroup)
+
+    @cached_property
+    def group_categories(self):
+        return self._load("group_categories", "group set", GroupCategory)
+
+    @cached_property
+    def sections(self):
+        return self._load("sections", "section", Section)
+
+    def _load(self, index_name, kind, content_class):
+        # Each index is named after the course endpoint it is listed from
+        return Index(kind, cached_list(self.course, self.cache, content_class, index_name))
+
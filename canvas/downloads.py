@@ -0,0 +1,177 @@
+"""
+A download engine for submission attachments that keeps memory flat and never
+leaves a truncated file under its final name.
+
+Each body is streamed in fixed-size chunks to a partial file next to the
+destination, checked against the expected size, fsynced and then atomically
+renamed into place. If a transfer breaks off, the partial file is kept and the
+next attempt (in this run or a later one) asks for the rest with an HTTP Range
+request instead of starting over. Bodies headed for an archive rather than a
+file are streamed chunk by chunk the same way, with `iter_download`.
+"""
+import glob
+import hashlib
+import os
+
+import requests
+from canvasapi.exceptions import CanvasException
+
+CHUNK_SIZE = 1024 * 1024
+
+# How many times a broken-off transfer is resumed before giving up
+RESUME_ATTEMPTS = 3
+
+
+class DownloadError(CanvasException):
+    """
+    Raised when a file could not be downloaded completely.
+    """
+
+
+def partial_path(path, tag=""):
+    """
+    Returns the hidden file next to path that a download into path is
+    streamed to. The tag (e.g. the attachment id) keeps a partial download of
+    one file from being resumed as another.
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{tag}.part")
+
+
+def download_file(requester, url, path, expected_size=None, tag="", chunk_size=CHUNK_SIZE):
+    """
+    Streams url to path, resuming from an earlier partial download if there
+    is one.
+
+    Args:
+        requester (Requester): The canvasapi requester whose session and
+            token to use.
+        url (str): The file's download URL.
+        path (str): The final destination.
+        expected_size (int): The size Canvas reports for the file, if known.
+        tag (str): Distinguishes partial downloads of different files to path.
+        chunk_size (int): Bytes read from the network and written per step.
+
+    Returns:
+        tuple: (number of bytes downloaded by this call, hex SHA-256 of the file).
+
+    Raises:
+        DownloadError: If the file could not be fetched completely.
+    """
+    part = partial_path(path, tag)
+    downloaded = 0
+    for attempt in range(1, RESUME_ATTEMPTS + 1):
+        try:
+            downloaded += _stream_to_partial(requester, url, part, chunk_size)
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == RESUME_ATTEMPTS:
+                raise DownloadError(f"Transfer of '{url}' kept breaking off: {e}")
+
+    size = os.path.getsize(part)
+    if expected_size is not None and size != expected_size:
+        if size > expected_size:
+            os.remove(part)
+        raise DownloadError(f"Expected {expected_size} bytes but received {size}")
+
+    digest = hashlib.sha256()
+    with open(part, "rb+") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+        os.fsync(f.fileno())
+    os.replace(part, path)
+    _fsync_directory(os.path.dirname(path))
+
+    # Partial downloads of files that used to be at this path are dead now
+    directory, name = os.path.split(path)
+    for stale in glob.glob(os.path.join(glob.escape(directory), glob.escape(f".{name}.") + "*.part")):
+        os.remove(stale)
+
+    return downloaded, digest.hexdigest()
+
+
+def iter_download(requester, url, expected_size=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields the body of url chunk by chunk, resuming a broken-off transfer
+    where it left off like `download_file` does, so only a chunk at a time
+    is in memory.
+
+    Args:
+        requester (Requester): The canvasapi requester whose session and
+            token to use.
+        url (str): The file's download URL.
+        expected_size (int): The size Canvas reports for the file, if known.
+        chunk_size (int): Bytes read from the network per step.
+
+    Raises:
+        DownloadError: If the file could not be fetched completely. Part of
+            it may have been yielded by then.
+    """
+    received = 0
+    for attempt in range(1, RESUME_ATTEMPTS + 1):
+        try:
+            response = _request_rest(requester, url, received)
+            if response is not None:
+                with response:
+                    # A plain 200 means the server ignored the Range header,
+                    # and what was yielded already can't be taken back
+                    if received and response.status_code != 206:
+                        raise DownloadError(f"Transfer of '{url}' broke off and could not be resumed")
+                    for chunk in response.iter_content(chunk_size):
+                        received += len(chunk)
+                        yield chunk
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == RESUME_ATTEMPTS:
+                raise DownloadError(f"Transfer of '{url}' kept breaking off: {e}")
+
+    if expected_size is not None and received != expected_size:
+        raise DownloadError(f"Expected {expected_size} bytes but received {received}")
+
+
+def _request_rest(requester, url, offset):
+    # Returns the streamed response for url from byte offset on, or None if
+    # there is nothing left to fetch
+    headers = {"Authorization": f"Bearer {requester.access_token}"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    response = requester._session.get(url, headers=headers, stream=True)
+    if response.status_code == 416:
+        response.close()
+        return None
+    if response.status_code >= 400:
+        response.close()
+        raise DownloadError(f"Encountered an error: status code {response.status_code}")
+    return response
+
+
+def _stream_to_partial(requester, url, part, chunk_size):
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    response = _request_rest(requester, url, offset)
+    if response is None:
+        # The partial file already holds everything there is
+        return 0
+
+    with response:
+        # A plain 200 means the server ignored the Range header
+        mode = "ab" if response.status_code == 206 else "wb"
+        written = 0
+        with open(part, mode) as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+
+def _fsync_directory(directory):
+    # Makes the rename durable; not possible (or needed) on every platform
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,423 @@
+"""
+A persistent on-disk cache for Canvas API listings, shared by the scripts in
+this repository.
+
+Listings are stored page by page in a SQLite file, keyed by endpoint and query
+parameters and tagged with the course and assignment they belong to, so that
+reruns can stream them back without touching the network. An entry is served
+from the cache while it is younger than its TTL and its validator (e.g. the
+assignment's `updated_at`) still matches. Once the TTL runs out, a listing can
+be revalidated with a cheap probe (e.g. what was graded since shortly before
+the newest `graded_at` seen) instead of being fetched again. The file is kept under a size limit by
+evicting the least recently used listings, and in offline mode every request
+is answered from the cache, however stale.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from canvasapi.course import Course
+from canvasapi.util import combine_kwargs
+
+from records import SubmissionRecord
+
+# Shared by every script, regardless of the directory it is run from
+DEFAULT_CACHE_FILE = os.path.expanduser("~/.cache/teaching-tools/canvas.sqlite")
+
+# How long entries stay fresh without asking Canvas, in seconds
+COURSE_TTL = 24 * 60 * 60
+LISTING_TTL = 60 * 60
+SUBMISSION_TTL = 10 * 60
+
+# Canvas timestamps have one-second resolution and its `*_since` filters are
+# strict, so revalidation probes start this many seconds before a watermark
+REVALIDATE_OVERLAP = 2
+
+# Least recently used listings are evicted once the file grows past this
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    course_id INTEGER,
+    assignment_id INTEGER,
+    endpoint TEXT NOT NULL,
+    validator TEXT,
+    watermarks TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (key, page)
+);
+CREATE INDEX IF NOT EXISTS listings_scope ON listings (course_id, assignment_id);
+CREATE INDEX IF NOT EXISTS listings_lru ON listings (accessed_at);
+"""
+
+
+class CacheMiss(Exception):
+    """
+    Raised in offline mode when a request has never been cached.
+    """
+
+
+def iter_pages(requester, endpoint, params):
+    """
+    Fetches a paginated Canvas listing, following the `Link: rel="next"`
+    headers, and yields the decoded JSON of each page.
+
+    Args:
+        requester (Requester): The canvasapi requester to send requests with.
+        endpoint (str): The API endpoint, relative to /api/v1/.
+        params (list): (name, value) tuples, as built by combine_kwargs.
+    """
+    response = requester.request("GET", endpoint, _kwargs=list(params))
+    yield response.json()
+    while "next" in response.links:
+        response = requester.request("GET", _url=response.links["next"]["url"])
+        yield response.json()
+
+
+def seconds_before(timestamp, seconds):
+    """
+    Returns a Canvas UTC timestamp moved the given number of seconds back.
+    """
+    moved = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ") - timedelta(seconds=seconds)
+    return moved.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def listing_key(endpoint, params):
+    """
+    Builds the cache key for an endpoint and its query parameters.
+    """
+    return endpoint + "?" + urlencode(sorted((str(k), str(v)) for k, v in params))
+
+
+class ListingCache:
+    """
+    A SQLite-backed cache of Canvas listings. See the module docstring.
+
+    Args:
+        path (str): The cache file, created along with its directory if needed.
+        max_bytes (int): The size above which old listings are evicted.
+        offline (bool): Serve everything from the cache and never call Canvas.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.page_fetcher = iter_pages
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._db.executescript(_SCHEMA)
+
+    @property
+    def _db(self):
+        # A sqlite3 connection can't be shared between threads, so each
+        # thread reading through the cache gets its own (close() may still
+        # close them from any thread). In WAL mode they can read while
+        # another one writes.
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def close(self):
+        with self._lock:
+            for db in self._connections:
+                db.close()
+            self._connections.clear()
+
+    def iter_listing(self, requester, endpoint, params=(), ttl=LISTING_TTL, course_id=None,
+                     assignment_id=None, validator=None, revalidate=None, watermark_fields=(),
+                     owns_scope=False):
+        """
+        Yields the items of a paginated listing, from the cache when possible.
+
+        Args:
+            requester (Requester): The canvasapi requester to fetch misses with.
+            endpoint (str): The API endpoint, relative to /api/v1/.
+            params (list): (name, value) query parameter tuples.
+            ttl (float): Seconds the listing is served without asking Canvas.
+            course_id (int): The course the listing belongs to.
+            assignment_id (int): The assignment the listing belongs to, if any.
+            validator (str): Any change to this value invalidates the entry.
+            revalidate (callable): Called with the stored watermarks and an
+                iterator over the cached items once the TTL has run out;
+                returning True marks the entry fresh again.
+            watermark_fields (tuple): Item fields whose newest value is stored
+                for `revalidate`.
+            owns_scope (bool): Refetching this listing also drops every other
+                entry cached for its assignment, since those were derived from it.
+        """
+        params = list(params)
+        key = listing_key(endpoint, params)
+        if self._is_fresh(key, ttl, validator, revalidate):
+            self._count("hits")
+            for items in self._cached_pages(key):
+                yield from items
+            return
+
+        self._count("misses")
+        if owns_scope and assignment_id is not None:
+            self.invalidate(course_id, assignment_id)
+        for items in self._fetch(requester, endpoint, params, key, course_id,
+                                 assignment_id, validator, watermark_fields):
+            yield from items
+
+    def get_object(self, requester, endpoint, params=(), ttl=LISTING_TTL, course_id=None,
+                   assignment_id=None, validator=None):
+        """
+        Returns the JSON of a single (unpaginated) Canvas object, from the
+        cache when possible. Arguments are as for `iter_listing`.
+        """
+        params = list(params)
+        key = listing_key(endpoint, params)
+        if self._is_fresh(key, ttl, validator, None):
+            self._count("hits")
+            return next(self._cached_pages(key))
+
+        self._count("misses")
+        pages = list(self._fetch(requester, endpoint, params, key, course_id,
+                                 assignment_id, validator, ()))
+        return pages[0]
+
+    def invalidate(self, course_id=None, assignment_id=None):
+        """
+        Drops every cached entry for a course, or for one of its assignments.
+        """
+        query = "SELECT key FROM listings WHERE course_id IS ?"
+        args = [course_id]
+        if assignment_id is not None:
+            query += " AND assignment_id = ?"
+            args.append(assignment_id)
+        with self._db:
+            for (key,) in self._db.execute(query, args).fetchall():
+                self._delete(key)
+
+    def invalidate_endpoint(self, endpoint):
+        """
+        Drops every cached listing of an endpoint, whatever its parameters,
+        e.g. after creating something that would appear in it.
+        """
+        with self._db:
+            for (key,) in self._db.execute("SELECT key FROM listings WHERE endpoint = ?",
+                                           (endpoint,)).fetchall():
+                self._delete(key)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _is_fresh(self, key, ttl, validator, revalidate):
+        row = self._db.execute(
+            "SELECT validator, watermarks, fetched_at FROM listings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            if self.offline:
+                raise CacheMiss(f"'{key}' is not cached and offline mode is on")
+            return False
+
+        stored_validator, watermarks, fetched_at = row
+        now = time.time()
+        fresh = self.offline
+        if not fresh and stored_validator == validator:
+            if now - fetched_at < ttl:
+                fresh = True
+            elif revalidate is not None and watermarks is not None:
+                fresh = revalidate(json.loads(watermarks), self._cached_items(key))
+                if fresh:
+                    with self._db:
+                        self._db.execute("UPDATE listings SET fetched_at = ? WHERE key = ?", (now, key))
+
+        if fresh:
+            with self._db:
+                self._db.execute("UPDATE listings SET accessed_at = ? WHERE key = ?", (now, key))
+        return fresh
+
+    def _cached_pages(self, key):
+        rows = self._db.execute("SELECT body FROM pages WHERE key = ? ORDER BY page", (key,))
+        for (body,) in rows:
+            yield json.loads(body)
+
+    def _cached_items(self, key):
+        for data in self._cached_pages(key):
+            yield from (data if isinstance(data, list) else [data])
+
+    def _fetch(self, requester, endpoint, params, key, course_id, assignment_id,
+               validator, watermark_fields):
+        # Pages are written under a partial key as they stream in and only
+        # take over the real key once the whole listing has been read, so an
+        # interrupted fetch never leaves a truncated entry behind
+        partial = key + "#partial"
+        with self._db:
+            self._db.execute("DELETE FROM pages WHERE key = ?", (partial,))
+        watermarks = {field: None for field in watermark_fields}
+        size = 0
+        for page, data in enumerate(self.page_fetcher(requester, endpoint, params)):
+            body = json.dumps(data)
+            size += len(body)
+            with self._db:
+                self._db.execute("INSERT INTO pages (key, page, body) VALUES (?, ?, ?)",
+                                 (partial, page, body))
+            for item in (data if isinstance(data, list) else [data]):
+                for field in watermark_fields:
+                    value = item.get(field)
+                    if value is not None and (watermarks[field] is None or value > watermarks[field]):
+                        watermarks[field] = value
+            yield data
+
+        now = time.time()
+        with self._db:
+            self._delete(key)
+            self._db.execute("UPDATE pages SET key = ? WHERE key = ?", (key, partial))
+            self._db.execute(
+                "INSERT INTO listings (key, course_id, assignment_id, endpoint, validator, "
+                "watermarks, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, course_id, assignment_id, endpoint, validator,
+                 json.dumps(watermarks) if watermark_fields else None, now, now, size))
+        self._evict()
+
+    def _delete(self, key):
+        self._db.execute("DELETE FROM pages WHERE key = ?", (key,))
+        self._db.execute("DELETE FROM listings WHERE key = ?", (key,))
+
+    def _evict(self):
+        with self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM listings").fetchone()[0]
+            rows = self._db.execute("SELECT key, size FROM listings ORDER BY accessed_at").fetchall()
+            for key, size in rows[:-1]:
+                if total <= self.max_bytes:
+                    break
+                self._delete(key)
+                total -= size
+
+
+def _version(submission):
+    return (submission.get("graded_at"), submission.get("submitted_at"), submission.get("score"))
+
+
+def _requester_of(canvas):
+    # canvasapi keeps the requester name-mangled on the Canvas object itself
+    return canvas._Canvas__requester
+
+
+def cached_course(canvas, cache, course_id):
+    """
+    Returns the Course object for course_id, from the cache when possible.
+    """
+    requester = _requester_of(canvas)
+    attributes = cache.get_object(requester, f"courses/{course_id}", ttl=COURSE_TTL,
+                                  course_id=int(course_id))
+    return Course(requester, attributes)
+
+
+def cached_list(course, cache, content_class, endpoint, ttl=LISTING_TTL, **kwargs):
+    """
+    Yields content_class objects for a course-level listing, such as
+    `assignments` or `assignment_groups`, from the cache when possible.
+
+    Args:
+        course (Course): The course the listing belongs to.
+        cache (ListingCache): The cache to read through.
+        content_class (type): The canvasapi class to build each item as.
+        endpoint (str): The endpoint, relative to the course, e.g. "assignments".
+        ttl (float): Seconds the listing is served without asking Canvas.
+        **kwargs: Query parameters, as accepted by canvasapi methods.
+    """
+    params = combine_kwargs(per_page=100, **kwargs)
+    for attributes in cache.iter_listing(course._requester, f"courses/{course.id}/{endpoint}",
+                                         params, ttl=ttl, course_id=course.id):
+        attributes["course_id"] = course.id
+        yield content_class(course._requester, attributes)
+
+
+def cached_graded_submissions(course, cache, assignment, **kwargs):
+    """
+    Yields the graded submissions of an assignment, as SubmissionRecords,
+    from the cache when possible.
+
+    The cached listing is dropped when the assignment's `updated_at` changes.
+    After SUBMISSION_TTL it is kept only if everything Canvas reports graded or
+    submitted since shortly before the newest `graded_at`/`submitted_at` it
+    contains is already in it, unchanged. That usually costs two small
+    requests instead of the whole listing.
+
+    Args:
+        course (Course): The course the assignment belongs to.
+        cache (ListingCache): The cache to read through.
+        assignment (Assignment): The assignment whose submissions to list.
+        **kwargs: Extra query parameters, e.g. include=["submission_comments"].
+    """
+    endpoint = f"courses/{course.id}/students/submissions"
+    params = combine_kwargs(assignment_ids=[assignment.id], student_ids=["all"],
+                            workflow_state="graded", per_page=100, **kwargs)
+
+    def revalidate(watermarks, cached):
+        probes = []
+        for field, since in (("graded_at", "graded_since"), ("submitted_at", "submitted_since")):
+            if watermarks.get(field) is not None:
+                probes.append(combine_kwargs(
+                    assignment_ids=[assignment.id], student_ids=["all"], per_page=100,
+                    **{since: seconds_before(watermarks[field], REVALIDATE_OVERLAP)}))
+        if not probes:
+            return True
+
+        # Anything in the overlap that the cached listing already holds, with
+        # the same timestamps and score, is not a change
+        versions = {item["id"]: _version(item) for item in cached}
+        for probe in probes:
+            for page in iter_pages(course._requester, endpoint, probe):
+                if any(versions.get(item["id"], False) != _version(item) for item in page):
+                    return False
+        return True
+
+    for attributes in cache.iter_listing(course._requester, endpoint, params,
+                                         ttl=SUBMISSION_TTL, course_id=course.id,
+                                         assignment_id=assignment.id,
+                                         validator=getattr(assignment, "updated_at", None),
+                                         revalidate=revalidate,
+                                         watermark_fields=("graded_at", "submitted_at"),
+                                         owns_scope=True):
+        yield SubmissionRecord.from_json(attributes)
+
+
+def cached_user_submissions(course, cache, assignment, user_ids, **kwargs):
+    """
+    Yields the submissions of the given users to an assignment, as
+    SubmissionRecords, fetched as a single listing and from the cache when
+    possible. It is dropped whenever the assignment's graded submission
+    listing is refetched, so it can outlive SUBMISSION_TTL.
+
+    Args:
+        course (Course): The course the assignment belongs to.
+        cache (ListingCache): The cache to read through.
+        assignment (Assignment): The assignment whose submissions to list.
+        user_ids (iterable): The users whose submissions to fetch.
+        **kwargs: Extra query parameters, e.g. include=["submission_comments"].
+    """
+    params = combine_kwargs(assignment_ids=[assignment.id], student_ids=sorted(user_ids),
+                            per_page=100, **kwargs)
+    for attributes in cache.iter_listing(course._requester, f"courses/{course.id}/students/submissions",
+                                         params, ttl=LISTING_TTL, course_id=course.id,
+                                         assignment_id=assignment.id,
+                                         validator=getattr(assignment, "updated_at", None)):
+        yield SubmissionRecord.from_json(attributes)
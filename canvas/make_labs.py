@@ -1,53 +1,74 @@
-from canvasapi import Canvas
 from datetime import datetime, timedelta
 
 import sys
 
+from bulk_create import create_assignments
+from catalog import CourseCatalog
+from listing_cache import ListingCache
+from ratelimit import connect
+from schedule import write_schedule
+
 CANVAS_TOKEN_FILE = "" # set this to a file containing your canvas API token
 
 API_URL = "https://wwu.instructure.com/" # set to your institution's canvas url
-API_KEY = open(CANVAS_TOKEN_FILE).read()
 COURSE_ID = "" # set this to your course id (found in the url of the course page)
-ASSIGNMENT_GRP_ID = "" # find this using canvas_recon
-
-# get course object
-canvas = Canvas(API_URL, API_KEY)
-course = canvas.get_course(COURSE_ID)
+ASSIGNMENT_GROUP = "" # name of the assignment group, as shown in canvas (canvas_recon lists them)
+TIME_ZONE = "America/Los_Angeles" # the time zone the dates below are in
 
 oneweek = timedelta(weeks=1)
-unlock = datetime(2023, 1, 10, 7, 0)
-due = datetime(2023, 1, 13, 22, 0)
+first_unlock = datetime(2023, 1, 10, 7, 0)
+first_due = datetime(2023, 1, 13, 22, 0)
 
 # point values for each lab, with a dummy at index 0 so the numbers line up
 points = ["_", 10, 15, 20, 30, 30, 30, 30, 30]
 
-for lab in range(1,9):
-    formats = ["py"] 
 
-    # hackily specify submission format special cases
-    if lab in [5, 8]:
-        formats.append("png")
+def lab_specs(assignment_group_id):
+    # build every lab's spec first, so they can all be created in one go
+    specs = []
+    unlock = first_unlock
+    due = first_due
+    for lab in range(1,9):
+        formats = ["py"]
+
+        # hackily specify submission format special cases
+        if lab in [5, 8]:
+            formats.append("png")
+
+        # create new assignment
+        lab_args = {
+            'name': f'Lab {lab}',
+            'submission_types': ['online_upload'],
+            'allowed_extensions': formats,
+            'notify_of_update': False,
+            'points_possible': points[lab],
+            'due_at': due,
+            'unlock_at': unlock,
+            'lock_at': None,
+            'description': f'<p>Writeup: <a href="https://facultyweb.cs.wwu.edu/~wehrwes/courses/csci141_23w/lab{lab}/">https://facultyweb.cs.wwu.edu/~wehrwes/courses/csci141_23w/lab{lab}/</a></p>',
+            'assignment_group_id': assignment_group_id,
+            'published': True,
+            'allowed_attempts': -1
+        }
+
+        due += oneweek
+        unlock += oneweek
 
-    # create new assignment
-    lab_args = {
-        'name': f'Lab {lab}',
-        'submission_types': ['online_upload'],
-        'allowed_extensions': formats,
-        'notify_of_update': False,
-        'points_possible': points[lab],
-        'due_at': due,
-        'unlock_at': unlock,
-        'lock_at': None,
-        'description': f'<p>Writeup: <a href="https://facultyweb.cs.wwu.edu/~wehrwes/courses/csci141_23w/lab{lab}/">https://facultyweb.cs.wwu.edu/~wehrwes/courses/csci141_23w/lab{lab}/</a></p>',
-        'assignment_group_id': ASSIGNMENT_GRP_ID,
-        'published': True,
-        'allowed_attempts': -1
-    }
+        specs.append(lab_args)
+    return specs
 
-    due += oneweek
-    unlock += oneweek
 
-    assgn = course.create_assignment(lab_args)
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--schedule":
+        # write the labs to a schedule file for reconcile_schedule.py instead of creating them
+        write_schedule(sys.argv[2], lab_specs(None), TIME_ZONE, assignment_group=ASSIGNMENT_GROUP)
+        sys.exit()
 
+    API_KEY = open(CANVAS_TOKEN_FILE).read()
 
+    # get course object and look up ids by name
+    canvas = connect(API_URL, API_KEY)
+    catalog = CourseCatalog.load(canvas, COURSE_ID, ListingCache())
 
+    # whichever labs don't exist yet get created
+    create_assignments(catalog, lab_specs(catalog.assignment_groups.id(ASSIGNMENT_GROUP)))
@@ -0,0 +1,128 @@
+"""
+A manifest of the files a download run has written, so that reruns can skip
+what is already correct on disk.
+
+Each output file is recorded under its path relative to the download directory
+along with the sample slot it fills (e.g. "Good/1234" for an assignment's Good
+sample) and where it came from: submission id, attempt, attachment id, size,
+`updated_at` and a SHA-256 of the bytes written. A file is current when its
+record matches the submission and attachment selected this time and the file on
+disk still has the recorded size and hash. Files that failed are never
+recorded, so the next run retries exactly those.
+"""
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_NAME = ".manifest.json"
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    """
+    Returns the hex SHA-256 of a file, read in fixed-size chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    """
+    The manifest stored in a download directory. Safe to share between
+    download worker threads; every change is saved to disk immediately so an
+    interrupted run keeps the progress it made.
+
+    Args:
+        root (str): The download directory the manifest describes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.files = json.load(f)
+        except FileNotFoundError:
+            self.files = {}
+        except ValueError:
+            print(f"Warning: ignoring unreadable manifest '{self.path}'")
+            self.files = {}
+
+    def is_current(self, rel_path, submission, attachment=None):
+        """
+        Returns whether rel_path already holds the given submission's
+        attachment (or, without an attachment, was written for this
+        submission attempt) and is intact on disk.
+        """
+        with self._lock:
+            entry = self.files.get(rel_path)
+        if entry is None or entry != {**entry, **_source(submission, attachment)}:
+            return False
+
+        full_path = os.path.join(self.root, rel_path)
+        try:
+            if os.path.getsize(full_path) != entry["size"]:
+                return False
+        except OSError:
+            return False
+        return file_sha256(full_path) == entry["sha256"]
+
+    def record(self, rel_path, slot, submission, attachment=None, sha256=None):
+        """
+        Records that rel_path now holds the given submission's attachment, or
+        a file derived from it such as its comment report.
+        """
+        full_path = os.path.join(self.root, rel_path)
+        entry = {
+            "slot": slot,
+            **_source(submission, attachment),
+            "size": os.path.getsize(full_path),
+            "sha256": sha256 or file_sha256(full_path),
+        }
+        with self._lock:
+            self.files[rel_path] = entry
+            self._save()
+
+    def prune_slot(self, slot, keep_paths):
+        """
+        Deletes the files a slot held before that are not in keep_paths, e.g.
+        after a different submission was selected for it.
+
+        Returns:
+            list: The relative paths that were removed.
+        """
+        with self._lock:
+            stale = [p for p, e in self.files.items() if e["slot"] == slot and p not in keep_paths]
+            for rel_path in stale:
+                del self.files[rel_path]
+                try:
+                    os.remove(os.path.join(self.root, rel_path))
+                except FileNotFoundError:
+                    pass
+            if stale:
+                self._save()
+        return stale
+
+    def _save(self):
+        # Written to a temporary file and renamed so a crash can't truncate it
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _source(submission, attachment):
+    source = {
+        "submission_id": submission.id,
+        "attempt": getattr(submission, "attempt", None),
+    }
+    if attachment is not None:
+        source["attachment_id"] = attachment.id
+        source["updated_at"] = getattr(attachment, "updated_at", None)
+    return source
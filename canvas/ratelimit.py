@@ -0,0 +1,227 @@
+"""
+A request scheduler that keeps the scripts under Canvas's rate limit while
+using as much of it as they can.
+
+Canvas gives each token a bucket of request quota that refills over time and
+reports what is left in the `X-Rate-Limit-Remaining` header (and what the
+request cost in `X-Request-Cost`). Once the bucket is empty, requests fail
+with 403 "Rate Limit Exceeded". The scheduler is mounted as the transport
+adapter of the canvasapi requester's session, so every request the scripts
+make goes through it, whether it comes from canvasapi or from our own code.
+
+It caps the number of requests in flight and adapts that cap the way TCP
+adapts its window: the cap grows slowly while plenty of quota is left and is
+halved as soon as the quota runs low, at which point requests are also spaced
+out so they spend no more than the bucket refills. Throttled requests, and
+idempotent ones that hit a 5xx error, are retried after a jittered exponential
+backoff, and a throttled response also holds back every other thread for that
+long.
+"""
+import random
+import threading
+import time
+
+from canvasapi import Canvas
+from requests.adapters import HTTPAdapter
+
+from tracing import tracer
+
+# Upper bound on requests in flight, however much quota is left
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Below LOW_WATER remaining quota the cap is halved and requests are paced to
+# the refill rate; above HIGH_WATER the cap grows
+LOW_WATER = 150.0
+HIGH_WATER = 400.0
+
+# Roughly how much quota Canvas gives back per second
+REFILL_RATE = 10.0
+
+# Retries for throttled and 5xx responses, and the backoff between them
+RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+_RETRYABLE_STATUS = (500, 502, 503, 504)
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class AdaptiveScheduler:
+    """
+    Admits requests under an adaptive concurrency cap. Shared by every
+    thread using the same session.
+
+    Args:
+        max_concurrency (int): The most requests ever allowed in flight.
+        initial_concurrency (int): The cap to start from.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, initial_concurrency=2):
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.in_flight = 0
+        self.remaining = None
+        self.cost = None
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.peak_in_flight = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, headers=None):
+        """
+        Marks a request as finished and adapts the cap to the quota reported
+        in its response headers, if any.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            remaining = _header_float(headers, "X-Rate-Limit-Remaining")
+            cost = _header_float(headers, "X-Request-Cost")
+            if cost is not None:
+                self.cost = cost if self.cost is None else 0.8 * self.cost + 0.2 * cost
+            if remaining is not None:
+                self.remaining = remaining
+                if remaining < LOW_WATER:
+                    self.limit = max(1.0, self.limit / 2)
+                    # Give the bucket time to refill what the next request costs,
+                    # or all of the shortfall once it is nearly empty
+                    if remaining < LOW_WATER / 3:
+                        pause = (LOW_WATER - remaining) / REFILL_RATE
+                    else:
+                        pause = (self.cost or 1.0) / REFILL_RATE
+                    self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                elif remaining > HIGH_WATER:
+                    # About one more slot per round of limit-many requests
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def backoff(self, attempt, throttled):
+        """
+        Sleeps before a retry. A throttled response collapses the cap and
+        makes every other thread wait out the same pause.
+        """
+        # Half fixed, half random, so retries spread out but never come right back
+        ceiling = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+        if throttled:
+            ceiling = max(ceiling, (self.cost or 1.0) / REFILL_RATE)
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        with self._cond:
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+                self.limit = 1.0
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        time.sleep(delay)
+
+    def summary(self):
+        """
+        Returns a one-line description of what the scheduler did.
+        """
+        remaining = "unknown" if self.remaining is None else f"{self.remaining:.0f}"
+        return (f"{self.requests} requests, peak {self.peak_in_flight} in flight, "
+                f"{self.retries} retries ({self.throttled} throttled), quota left {remaining}")
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that sends every request through an AdaptiveScheduler and
+    retries throttled and transient server errors.
+
+    Args:
+        scheduler (AdaptiveScheduler): The scheduler to admit requests through.
+        pool_size (int): Keep-alive connections to hold open per host.
+    """
+
+    def __init__(self, scheduler, pool_size=DEFAULT_MAX_CONCURRENCY):
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.scheduler = scheduler
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            response = None
+            start = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            finally:
+                headers = response.headers if response is not None else None
+                self.scheduler.release(headers)
+                size = headers.get("Content-Length") if headers is not None else None
+                tracer.record_request(request.method, request.url,
+                                      response.status_code if response is not None else None,
+                                      start, time.perf_counter(), int(size) if size else None, attempt)
+
+            throttled = _is_throttled(response)
+            retryable = throttled or (response.status_code in _RETRYABLE_STATUS and
+                                      request.method in _IDEMPOTENT_METHODS)
+            if not retryable or attempt >= RETRIES:
+                return response
+
+            response.close()
+            attempt += 1
+            with tracer.phase("rate limit backoff"):
+                self.scheduler.backoff(attempt, throttled)
+
+
+def install_scheduler(requester, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Routes every request made through a canvasapi requester's session
+    through an AdaptiveScheduler. Installing twice keeps the first scheduler
+    but makes sure the connection pool can hold max_concurrency connections.
+
+    Returns:
+        AdaptiveScheduler: The scheduler in use.
+    """
+    current = requester._session.get_adapter("https://")
+    if isinstance(current, RateLimitedAdapter):
+        if current._pool_maxsize >= max_concurrency:
+            return current.scheduler
+        scheduler = current.scheduler
+        scheduler.max_concurrency = max(scheduler.max_concurrency, max_concurrency)
+    else:
+        scheduler = AdaptiveScheduler(max_concurrency)
+
+    adapter = RateLimitedAdapter(scheduler, pool_size=max_concurrency)
+    requester._session.mount("https://", adapter)
+    requester._session.mount("http://", adapter)
+    return scheduler
+
+
+def connect(api_url, api_key, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Returns a Canvas object whose requests all go through a scheduler.
+    """
+    canvas = Canvas(api_url, api_key)
+    install_scheduler(canvas._Canvas__requester, max_concurrency)
+    return canvas
+
+
+def _is_throttled(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and "rate limit exceeded" in response.text.lower()
+
+
+def _header_float(headers, name):
+    if headers is None or name not in headers:
+        return None
+    try:
+        return float(headers[name])
+    except ValueError:
+        return None
@@ -0,0 +1,50 @@
+"""
+Brings a course's assignments in line with a schedule file (see schedule.py
+for the format): creates the missing ones and updates the ones that changed,
+with as few API calls as Canvas allows. With --prune it also deletes the
+assignments in the schedule's groups that it no longer lists.
+
+make_labs.py --schedule FILE and generate_exercise_assignments.py --schedule
+FILE write their terms out as schedule files to start from.
+
+    python reconcile_schedule.py --dry-run    # print the plan and what it costs
+    python reconcile_schedule.py              # apply it
+    python reconcile_schedule.py --prune      # and delete what it dropped
+"""
+import argparse
+
+from catalog import CourseCatalog
+from listing_cache import ListingCache
+from ratelimit import connect
+from schedule import apply_plan, load_schedule, plan_changes, print_plan
+
+CANVAS_TOKEN_FILE = "" # set this to a file containing your canvas API token
+
+API_URL = "https://wwu.instructure.com/" # set to your institution's canvas url
+COURSE_ID = "" # set this to your course id (found in the url of the course page)
+
+SCHEDULE_FILE = "schedule.json" # the schedule to reconcile the course with
+
+# Delete the assignments in the schedule's groups that it doesn't list. Leave
+# this off when other schedules (e.g. labs and exercises) share those groups.
+PRUNE = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile a course's assignments with a schedule file.")
+    parser.add_argument("schedule", nargs="?", default=SCHEDULE_FILE,
+                        help="the schedule file (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the planned changes and their API call count without making them")
+    parser.add_argument("--prune", action="store_true", default=PRUNE,
+                        help="delete assignments in the schedule's groups that it doesn't list")
+    args = parser.parse_args()
+
+    API_KEY = open(CANVAS_TOKEN_FILE).read()
+    canvas = connect(API_URL, API_KEY)
+    catalog = CourseCatalog.load(canvas, COURSE_ID, ListingCache())
+
+    plan = plan_changes(catalog, load_schedule(args.schedule, catalog), prune=args.prune)
+    print_plan(plan, catalog)
+    if plan and not args.dry_run:
+        apply_plan(catalog, plan)
@@ -0,0 +1,82 @@
+"""
+Compact records of the parts of a submission the scripts actually use.
+
+A canvasapi Submission keeps the whole JSON object it was built from, and
+parses every date in it on construction, which adds up when an assignment has
+thousands of submissions. These records are built straight from each decoded
+page instead, keep only a few fields in `__slots__`, and leave dates as the
+ISO 8601 strings Canvas sent (which still sort correctly). They use the same
+attribute names as canvasapi's objects, so code written for a Submission
+works unchanged with them.
+"""
+
+# Comment fields kept for the comment reports
+COMMENT_FIELDS = ("author_name", "created_at", "comment")
+
+
+class AttachmentRecord:
+    """
+    A file attached to a submission.
+    """
+
+    __slots__ = ("id", "filename", "url", "size", "updated_at")
+
+    def __init__(self, id, filename, url, size, updated_at):
+        self.id = id
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_json(cls, attributes):
+        return cls(attributes["id"], attributes.get("filename") or attributes.get("display_name"),
+                   attributes.get("url"), attributes.get("size"), attributes.get("updated_at"))
+
+    def __repr__(self):
+        return f"AttachmentRecord({self.filename} ({self.id}))"
+
+
+class SubmissionRecord:
+    """
+    A submission, with its attachments and, if they were requested, the
+    author, date and text of its comments.
+    """
+
+    __slots__ = ("id", "user_id", "assignment_id", "score", "attempt", "workflow_state",
+                 "submitted_at", "graded_at", "attachments", "submission_comments")
+
+    def __init__(self, id, user_id, assignment_id, score, attempt, workflow_state,
+                 submitted_at, graded_at, attachments, submission_comments):
+        self.id = id
+        self.user_id = user_id
+        self.assignment_id = assignment_id
+        self.score = score
+        self.attempt = attempt
+        self.workflow_state = workflow_state
+        self.submitted_at = submitted_at
+        self.graded_at = graded_at
+        self.attachments = attachments
+        self.submission_comments = submission_comments
+
+    @classmethod
+    def from_json(cls, attributes):
+        """
+        Builds a record from a submission object as returned by the API.
+        """
+        return cls(
+            attributes["id"],
+            attributes.get("user_id"),
+            attributes.get("assignment_id"),
+            attributes.get("score"),
+            attributes.get("attempt"),
+            attributes.get("workflow_state"),
+            attributes.get("submitted_at"),
+            attributes.get("graded_at"),
+            tuple(AttachmentRecord.from_json(a) for a in attributes.get("attachments") or ()),
+            tuple({field: comment.get(field) for field in COMMENT_FIELDS}
+                  for comment in attributes.get("submission_comments") or ()),
+        )
+
+    def __repr__(self):
+        return f"SubmissionRecord({self.id}, user {self.user_id}, score {self.score})"
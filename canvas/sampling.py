@@ -0,0 +1,266 @@
+"""
+Vectorized selection of submission examples by score percentile, and the
+grade distribution report that goes with it.
+
+The graded submissions of each assignment are gathered into compact score
+columns as their listing streams in. The selection is then made for every
+assignment in one pass: all columns are concatenated, sorted by assignment,
+score and submission time at once, and the position of every (assignment,
+percentile) pair, plus the k - 1 neighbours sampled with it, is computed as
+one array. Submissions with equal scores are ordered by when they were
+submitted, earliest first.
+
+The columns can also be kept up to date in place as submissions are graded,
+regraded or resubmitted (see `ScoreColumns.update`), so that a long-running
+process only has to select again, not list everything again.
+"""
+import csv
+from array import array
+
+import numpy as np
+
+# How a percentile p maps to a position among n submissions sorted by score.
+# "legacy" is the original int(n * p) - 1 rule; the others are the methods of
+# numpy.quantile, with fractional positions rounded to the nearest submission.
+QUANTILE_METHODS = (
+    "legacy", "inverted_cdf", "averaged_inverted_cdf", "closest_observation",
+    "interpolated_inverted_cdf", "hazen", "weibull", "linear", "median_unbiased",
+    "normal_unbiased", "lower", "higher", "midpoint", "nearest",
+)
+
+# The distribution report's histogram splits 0-100% into this many bins
+HISTOGRAM_BINS = 10
+
+
+class ScoreColumns:
+    """
+    The graded submissions with files of one assignment, as columns.
+
+    Attributes:
+        newest (dict): The newest `graded_at` and `submitted_at` among all
+            the submissions given to `add` and `update`, included or not.
+        versions (dict): With track_versions, {submission id: (graded_at,
+            submitted_at, score)} of all those submissions; otherwise None.
+
+    Args:
+        assignment (Assignment): The assignment they belong to.
+        track_versions (bool): Whether to keep `versions`.
+    """
+
+    __slots__ = ("assignment", "scores", "user_ids", "submitted_at", "rows", "newest", "versions")
+
+    def __init__(self, assignment, track_versions=False):
+        self.assignment = assignment
+        self.scores = array("d")
+        self.user_ids = array("q")
+        self.submitted_at = []
+        self.rows = {}
+        self.newest = {"graded_at": None, "submitted_at": None}
+        self.versions = {} if track_versions else None
+
+    def add(self, submission):
+        """
+        Adds a submission, unless it is ungraded or has no files.
+        """
+        self._see(submission)
+        if getattr(submission, "score", None) is None or not getattr(submission, "attachments", None):
+            return
+        self.rows[submission.user_id] = len(self.scores)
+        self.scores.append(submission.score)
+        self.user_ids.append(submission.user_id)
+        self.submitted_at.append(getattr(submission, "submitted_at", None))
+
+    def update(self, submission):
+        """
+        Replaces a user's submission with a newer version of it: adds it if
+        it is now graded, changes its score and time, or drops it if it no
+        longer counts (e.g. it was resubmitted and awaits grading).
+
+        Returns:
+            bool: Whether the columns changed.
+        """
+        row = self.rows.get(submission.user_id)
+        counts = (getattr(submission, "workflow_state", "graded") == "graded"
+                  and getattr(submission, "score", None) is not None
+                  and bool(getattr(submission, "attachments", None)))
+        if row is None:
+            if counts:
+                self.add(submission)
+            else:
+                self._see(submission)
+            return counts
+
+        self._see(submission)
+        if counts:
+            changed = (self.scores[row], self.submitted_at[row]) != (submission.score, submission.submitted_at)
+            self.scores[row] = submission.score
+            self.submitted_at[row] = submission.submitted_at
+            return changed
+
+        # Move the last row into its place
+        last = len(self.scores) - 1
+        for column in (self.scores, self.user_ids, self.submitted_at):
+            column[row] = column[last]
+            column.pop()
+        del self.rows[submission.user_id]
+        if row != last:
+            self.rows[self.user_ids[row]] = row
+        return True
+
+    def _see(self, submission):
+        if self.versions is not None:
+            self.versions[submission.id] = (getattr(submission, "graded_at", None),
+                                            getattr(submission, "submitted_at", None),
+                                            getattr(submission, "score", None))
+        for field in self.newest:
+            value = getattr(submission, field, None)
+            if value is not None and (self.newest[field] is None or value > self.newest[field]):
+                self.newest[field] = value
+
+    def __len__(self):
+        return len(self.scores)
+
+
+class Selection:
+    """
+    The examples chosen for one assignment and the statistics of its scores.
+
+    Attributes:
+        assignment (Assignment): The assignment.
+        samples (dict): {label: [user_id, ...]}, lowest score first.
+        positions (dict): {label: [position, ...]}, each submission's
+            0-based rank in ascending score order.
+        stats (dict): n, mean, stdev, min, median, max and the histogram
+            (counts per HISTOGRAM_BINS bins of percent score).
+    """
+
+    def __init__(self, assignment, samples, positions, stats):
+        self.assignment = assignment
+        self.samples = samples
+        self.positions = positions
+        self.stats = stats
+
+
+def quantile_positions(sizes, percentiles, method="legacy"):
+    """
+    Returns the position of each percentile among n sorted submissions, for
+    every n in sizes.
+
+    Args:
+        sizes (ndarray): Submission counts, all at least 1.
+        percentiles (ndarray): Percentiles between 0.0 and 1.0.
+        method (str): One of QUANTILE_METHODS.
+
+    Returns:
+        ndarray: An int array of shape (len(sizes), len(percentiles)).
+    """
+    if method not in QUANTILE_METHODS:
+        raise ValueError(f"Unknown quantile method '{method}' (choose from {', '.join(QUANTILE_METHODS)})")
+    if method == "legacy":
+        return np.maximum(0, np.floor(sizes[:, None] * percentiles[None, :]).astype(int) - 1)
+
+    # The p-quantile of the positions 0..n-1 is the (possibly fractional)
+    # position numpy would take the quantile at. Assignments tend to share
+    # a few sizes, so each distinct size is worked out once.
+    distinct, inverse = np.unique(sizes, return_inverse=True)
+    table = np.array([np.quantile(np.arange(n), percentiles, method=method) for n in distinct])
+    positions = np.floor(table[inverse] + 0.5).astype(int)
+    return np.clip(positions, 0, sizes[:, None] - 1)
+
+
+def select_samples(columns, percentiles, k=1, method="legacy"):
+    """
+    Chooses k submissions at each percentile of every assignment at once.
+
+    The k samples of a percentile are the submission at its position and
+    the ones sorted right around it, shifted to stay within the assignment.
+    Buckets may overlap when they are close together or k is large.
+
+    Args:
+        columns (list): ScoreColumns, one per assignment, none of them empty.
+        percentiles (dict): Maps a label to a percentile between 0.0 and 1.0.
+        k (int): Submissions to sample per percentile.
+        method (str): One of QUANTILE_METHODS.
+
+    Returns:
+        list: A Selection per ScoreColumns, in the same order.
+    """
+    if not columns:
+        return []
+    labels = list(percentiles)
+    sizes = np.array([len(c) for c in columns])
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    group = np.repeat(np.arange(len(columns)), sizes)
+    scores = np.concatenate([np.frombuffer(c.scores, dtype=np.float64) for c in columns])
+    user_ids = np.concatenate([np.frombuffer(c.user_ids, dtype=np.int64) for c in columns])
+    # Canvas sends UTC timestamps ending in Z; missing ones sort last
+    submitted = np.array([t[:19] if t else "NaT" for c in columns for t in c.submitted_at],
+                         dtype="datetime64[s]")
+
+    # lexsort sorts by its last key first
+    order = np.lexsort((submitted, scores, group))
+    sorted_scores = scores[order]
+    sorted_users = user_ids[order]
+
+    # Positions of every sample, shape (assignments, percentiles, k)
+    centres = quantile_positions(sizes, np.array([percentiles[label] for label in labels]), method)
+    k = max(1, int(k))
+    starts = np.clip(centres - (k - 1) // 2, 0, np.maximum(sizes - k, 0)[:, None])
+    positions = starts[:, :, None] + np.arange(k)
+    valid = positions < sizes[:, None, None]
+    chosen = sorted_users[np.minimum(offsets[:, None, None] + positions, len(order) - 1)]
+
+    stats = _distribution(columns, group, sizes, offsets, scores, sorted_scores)
+
+    selections = []
+    for g, c in enumerate(columns):
+        samples = {label: chosen[g, p][valid[g, p]].tolist() for p, label in enumerate(labels)}
+        sample_positions = {label: positions[g, p][valid[g, p]].tolist() for p, label in enumerate(labels)}
+        selections.append(Selection(c.assignment, samples, sample_positions, stats[g]))
+    return selections
+
+
+def _distribution(columns, group, sizes, offsets, scores, sorted_scores):
+    # Per-assignment sums via bincount, so this is one pass over all scores too
+    count = len(columns)
+    sums = np.bincount(group, weights=scores, minlength=count)
+    squares = np.bincount(group, weights=scores * scores, minlength=count)
+    means = sums / sizes
+    stdevs = np.sqrt(np.maximum(squares / sizes - means * means, 0) * sizes / np.maximum(sizes - 1, 1))
+    lows = sorted_scores[offsets]
+    highs = sorted_scores[offsets + sizes - 1]
+    middle = offsets + (sizes - 1) // 2
+    medians = np.where(sizes % 2 == 1, sorted_scores[middle],
+                       (sorted_scores[middle] + sorted_scores[np.minimum(middle + 1, offsets + sizes - 1)]) / 2)
+
+    points = np.array([getattr(c.assignment, "points_possible", None) or 100 for c in columns], dtype=float)
+    percent = scores / points[group] * 100
+    bins = np.clip((percent // (100 / HISTOGRAM_BINS)).astype(int), 0, HISTOGRAM_BINS - 1)
+    histograms = np.bincount(group * HISTOGRAM_BINS + bins,
+                             minlength=count * HISTOGRAM_BINS).reshape(count, HISTOGRAM_BINS)
+
+    return [{"n": int(sizes[g]), "mean": float(means[g]), "stdev": float(stdevs[g]),
+             "min": float(lows[g]), "median": float(medians[g]), "max": float(highs[g]),
+             "histogram": histograms[g].tolist()}
+            for g in range(count)]
+
+
+def write_distribution_csv(selections, f):
+    """
+    Writes one row per assignment with its score statistics, histogram and
+    the positions of the submissions chosen for each percentile to f, a text
+    file opened with newline="".
+    """
+    width = 100 // HISTOGRAM_BINS
+    bins = [f"{b * width}-{(b + 1) * width}%" for b in range(HISTOGRAM_BINS)]
+    labels = list(selections[0].positions) if selections else []
+    writer = csv.writer(f)
+    writer.writerow(["assignment_id", "assignment", "n", "mean", "stdev", "min", "median", "max"]
+                    + bins + [f"{label} positions" for label in labels])
+    for selection in selections:
+        stats = selection.stats
+        writer.writerow(
+            [selection.assignment.id, selection.assignment.name, stats["n"]]
+            + [round(stats[key], 3) for key in ("mean", "stdev", "min", "median", "max")]
+            + stats["histogram"]
+            + [" ".join(str(p) for p in selection.positions[label]) for label in labels])
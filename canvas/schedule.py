@@ -0,0 +1,447 @@
+"""
+Reconciles a course's assignments with a declarative schedule file.
+
+A schedule is a JSON file listing the assignments the course should have:
+
+    {
+      "time_zone": "America/Los_Angeles",
+      "defaults": {"submission_types": ["online_upload"], "published": true},
+      "assignments": [
+        {"name": "Lab 1", "assignment_group": "Labs", "points_possible": 10,
+         "unlock_at": "2023-01-10 07:00", "due_at": "2023-01-13 22:00",
+         "overrides": [{"section": "Section 2", "due_at": "2023-01-13 10:00"}]}
+      ]
+    }
+
+Each assignment takes the fields `course.create_assignment` accepts, plus
+`defaults`. `assignment_group` and `group_set` name the assignment group and
+group set as shown in Canvas, and `section` names the section an override is
+for. Dates without a UTC offset are in `time_zone`.
+
+`plan_changes` fetches the course's assignments, with their overrides, once
+and works out the smallest set of changes:
+- assignments the course doesn't have are created, listed in their group
+  in schedule order (see bulk_create), and their overrides are added in
+  batches afterwards;
+- assignments whose fields differ are updated. When only dates changed, of
+  the assignment or of its section overrides, the change goes into a single
+  bulk date update for the whole course instead of a call per assignment;
+- section overrides are added in batches, and the ones a scheduled
+  assignment's "overrides" no longer list are deleted (assignments without
+  an "overrides" key keep whatever overrides they have);
+- with prune, assignments in the schedule's assignment groups that it
+  doesn't list are deleted, unless students have submitted to them or any
+  of them are graded (e.g. an on-paper exercise). Leave it off when several
+  schedules share a group, such as the labs' and the exercises'.
+
+Assignments are matched by name and assignment group, or by name alone when
+the schedule doesn't give the group, like in bulk_create.
+"""
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from canvasapi.assignment import Assignment
+from canvasapi.progress import Progress
+
+from bulk_create import DEFAULT_CONCURRENCY, creation_batches, index_assignments, spec_key, with_positions
+from listing_cache import cached_list
+
+# Canvas creates at most this many overrides per batch request
+OVERRIDE_BATCH_SIZE = 50
+
+# How often, and for how long, to check on a bulk date update
+PROGRESS_POLL_INTERVAL = 0.5
+PROGRESS_TIMEOUT = 120
+
+DATE_FIELDS = ("due_at", "unlock_at", "lock_at")
+
+# Accepted when creating or editing an assignment, but not part of what Canvas returns
+WRITE_ONLY_FIELDS = ("notify_of_update",)
+
+
+class Plan:
+    """
+    The changes that bring a course in line with a schedule.
+
+    Attributes:
+        creates (list): Specs of the assignments to create, overrides and
+            positions included.
+        edits (list): (assignment, {field: value}) pairs for changes that
+            aren't only dates.
+        date_updates (list): (assignment, all_dates) pairs for the bulk date
+            update, all_dates being the new dates of the assignment itself
+            ("base": True) and/or of its overrides ("id": override id).
+        override_creates (list): (assignment, override) pairs of overrides to
+            add to existing assignments.
+        override_deletes (list): (assignment, override) pairs to delete.
+        deletes (list): Assignments to delete.
+        kept (list): Assignments the schedule dropped that have submissions
+            or grades, so they are left alone.
+        unchanged (int): Scheduled assignments that already match.
+    """
+
+    def __init__(self):
+        self.creates = []
+        self.edits = []
+        self.date_updates = []
+        self.override_creates = []
+        self.override_deletes = []
+        self.deletes = []
+        self.kept = []
+        self.unchanged = 0
+
+    def __len__(self):
+        return (len(self.creates) + len(self.edits) + len(self.date_updates) + len(self.override_creates)
+                + len(self.override_deletes) + len(self.deletes))
+
+    def api_calls(self):
+        """
+        Returns the number of requests applying the plan takes, counting one
+        progress check for the bulk date update.
+        """
+        overrides = len(self.override_creates) + sum(len(spec.get("overrides", ())) for spec in self.creates)
+        return (len(self.creates) + len(self.edits) + len(self.override_deletes) + len(self.deletes)
+                + math.ceil(overrides / OVERRIDE_BATCH_SIZE) + (2 if self.date_updates else 0))
+
+    def one_by_one_calls(self):
+        """
+        Returns the number of requests the same changes would take with a
+        call per assignment and per section override.
+        """
+        return (len(self) - len(self.date_updates)
+                + sum(len(spec.get("overrides", ())) for spec in self.creates)
+                + sum(len(all_dates) for _, all_dates in self.date_updates))
+
+
+def canvas_time(value, zone):
+    """
+    Returns a date from a schedule (a datetime or an ISO 8601 string, taken
+    to be in zone when it has no offset) as the UTC timestamp Canvas uses.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=zone)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def load_schedule(path, catalog):
+    """
+    Reads a schedule file and resolves the names in it.
+
+    Args:
+        path (str): The schedule file.
+        catalog (CourseCatalog): The catalog of the course it is for.
+
+    Returns:
+        list: An assignment spec per scheduled assignment, with ids in place
+        of names and UTC dates.
+
+    Raises:
+        ValueError: If the file is malformed.
+        LookupError: If it names a group, group set or section the course doesn't have.
+    """
+    with open(path, encoding="utf-8") as f:
+        schedule = json.load(f)
+    if "time_zone" not in schedule:
+        raise ValueError(f"Schedule '{path}' must set the time_zone its dates are in")
+    zone = ZoneInfo(schedule["time_zone"])
+    defaults = schedule.get("defaults", {})
+
+    specs = []
+    for entry in schedule.get("assignments", []):
+        spec = dict(defaults, **entry)
+        if "name" not in spec:
+            raise ValueError(f"Every assignment in '{path}' needs a name: {entry}")
+        if "assignment_group" in spec:
+            spec["assignment_group_id"] = catalog.assignment_groups.id(spec.pop("assignment_group"))
+        if "group_set" in spec:
+            spec["group_category_id"] = catalog.group_categories.id(spec.pop("group_set"))
+        for field in DATE_FIELDS:
+            if field in spec:
+                spec[field] = canvas_time(spec[field], zone)
+        if "overrides" in spec:
+            overrides = []
+            for override in spec["overrides"]:
+                resolved = {"course_section_id": catalog.sections.id(override["section"])}
+                for field in DATE_FIELDS:
+                    if field in override:
+                        resolved[field] = canvas_time(override[field], zone)
+                overrides.append(resolved)
+            spec["overrides"] = overrides
+        specs.append(spec)
+    return specs
+
+
+def write_schedule(path, specs, time_zone, assignment_group=None, group_set=None):
+    """
+    Writes assignment specs as a schedule file, e.g. to turn a term that a
+    script builds into a file to edit from then on.
+
+    Args:
+        path (str): The file to write.
+        specs (list): Assignment dicts, with naive datetimes in time_zone.
+        time_zone (str): The IANA time zone of the dates, e.g. "America/Los_Angeles".
+        assignment_group (str): Name to write in place of every assignment_group_id.
+        group_set (str): Name to write in place of every group_category_id.
+    """
+    names = {"assignment_group_id": ("assignment_group", assignment_group),
+             "group_category_id": ("group_set", group_set)}
+    entries = []
+    for spec in specs:
+        entry = {}
+        for field, value in spec.items():
+            name_field, name = names.get(field, (field, None))
+            entry[name_field] = value if name is None else name
+        entries.append(entry)
+
+    def local_time(value):
+        if isinstance(value, datetime):
+            return value.isoformat(sep=" ", timespec="minutes")
+        raise TypeError(f"Can't write {value!r} to a schedule")
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"time_zone": time_zone, "assignments": entries}, f, indent=2, default=local_time)
+    print(f"Wrote {len(entries)} assignments to '{path}'")
+
+
+def plan_changes(catalog, specs, prune=False):
+    """
+    Compares scheduled assignments with the course's, fetched fresh from
+    Canvas with their overrides.
+
+    Args:
+        catalog (CourseCatalog): The catalog of the course.
+        specs (list): Assignment specs, as returned by `load_schedule`.
+        prune (bool): Also delete the assignments in the schedule's groups
+            that it doesn't list.
+
+    Returns:
+        Plan: What to create, update and delete.
+
+    Raises:
+        ValueError: If the schedule lists an assignment twice.
+    """
+    assignments = list(cached_list(catalog.course, catalog.cache, Assignment, "assignments",
+                                   ttl=0, include=["overrides"]))
+    existing = index_assignments(assignments)
+
+    plan = Plan()
+    scheduled = set()
+    matched = set()
+    for spec in specs:
+        key = spec_key(spec)
+        if key in scheduled:
+            raise ValueError(f"'{spec['name']}' is in the schedule twice")
+        scheduled.add(key)
+        if key not in existing:
+            plan.creates.append(spec)
+            continue
+        assignment = existing[key]
+        if assignment.id in matched:
+            raise ValueError(f"'{spec['name']}' is in the schedule twice, with and without its assignment group")
+        matched.add(assignment.id)
+        before = len(plan)
+        _plan_update(plan, assignment, spec)
+        plan.unchanged += len(plan) == before
+    plan.creates = with_positions(plan.creates, assignments)
+
+    if not prune:
+        return plan
+
+    # Whatever else is in the schedule's groups was dropped from it, as are
+    # duplicates of scheduled assignments
+    groups = {str(spec["assignment_group_id"]) for spec in specs if spec.get("assignment_group_id")}
+    for assignment in assignments:
+        if (str(getattr(assignment, "assignment_group_id", "")) in groups
+                and assignment.id not in matched):
+            if (getattr(assignment, "has_submitted_submissions", False)
+                    or getattr(assignment, "graded_submissions_exist", False)):
+                plan.kept.append(assignment)
+            else:
+                plan.deletes.append(assignment)
+    return plan
+
+
+def _plan_update(plan, assignment, spec):
+    fields = {}
+    dates = {}
+    for field, value in spec.items():
+        if field in ("name", "overrides") or field in WRITE_ONLY_FIELDS:
+            continue
+        if not _same(getattr(assignment, field, None), value):
+            (dates if field in DATE_FIELDS else fields)[field] = value
+
+    all_dates = []
+    if fields:
+        plan.edits.append((assignment, dict(fields, **dates)))
+    elif dates:
+        all_dates.append(dict(_dates_of(assignment), base=True, **dates))
+
+    if "overrides" in spec:
+        # Only section overrides are managed; ones for students or groups stay
+        current = {getattr(o, "course_section_id", None): o for o in getattr(assignment, "overrides", [])}
+        current.pop(None, None)
+        for override in spec["overrides"]:
+            existing = current.pop(override["course_section_id"], None)
+            if existing is None:
+                plan.override_creates.append((assignment, override))
+                continue
+            changes = {field: override[field] for field in DATE_FIELDS
+                       if field in override and not _same(getattr(existing, field, None), override[field])}
+            if changes:
+                all_dates.append(dict(_dates_of(existing), id=existing.id, **changes))
+        plan.override_deletes += [(assignment, override) for override in current.values()]
+
+    if all_dates:
+        plan.date_updates.append((assignment, all_dates))
+
+
+def _dates_of(obj):
+    # The bulk date update resets any date it isn't given, so every entry has all of them
+    return {field: getattr(obj, field, None) for field in DATE_FIELDS}
+
+
+def _same(current, wanted):
+    if current is None or wanted is None:
+        return not current and not wanted
+    if isinstance(wanted, bool):
+        return current in (wanted, str(wanted).lower())
+    if isinstance(wanted, (int, float)):
+        try:
+            return float(current) == float(wanted)
+        except (TypeError, ValueError):
+            return False
+    if isinstance(wanted, (list, tuple)):
+        return list(current) == list(wanted)
+    return str(current) == str(wanted)
+
+
+def print_plan(plan, catalog):
+    """
+    Prints every planned change and how many requests applying them takes.
+    """
+    def section(section_id):
+        found = catalog.sections.by_id.get(section_id)
+        return f"'{found.name}'" if found is not None else str(section_id)
+
+    for spec in plan.creates:
+        overrides = len(spec.get("overrides", ()))
+        print(f"  create '{spec['name']}'" + (f" with {overrides} section overrides" if overrides else ""))
+    for assignment, changes in plan.edits:
+        print(f"  update '{assignment.name}': {', '.join(changes)}")
+    for assignment, all_dates in plan.date_updates:
+        what = ["its own" if entry.get("base") else "an override's" for entry in all_dates]
+        print(f"  move dates of '{assignment.name}' ({', '.join(what)})")
+    for assignment, override in plan.override_creates:
+        print(f"  add override for section {section(override['course_section_id'])} to '{assignment.name}'")
+    for assignment, override in plan.override_deletes:
+        print(f"  delete override '{getattr(override, 'title', override.id)}' of '{assignment.name}'")
+    for assignment in plan.deletes:
+        print(f"  delete '{assignment.name}'")
+    for assignment in plan.kept:
+        print(f"  keep '{assignment.name}': not in the schedule, but it has submissions or grades")
+    print(f"{len(plan.creates)} to create, {len(plan.edits) + len(plan.date_updates)} to update, "
+          f"{len(plan.deletes)} to delete, {plan.unchanged} unchanged")
+    print(f"Applying this takes {plan.api_calls()} API calls "
+          f"({plan.one_by_one_calls()} with one call per assignment and section)")
+
+
+def apply_plan(catalog, plan, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Makes the planned changes, printing every failure and a summary.
+
+    Args:
+        catalog (CourseCatalog): The catalog of the course.
+        plan (Plan): The changes, from `plan_changes`.
+        concurrency (int): The maximum number of requests in flight.
+
+    Returns:
+        int: The number of changes that failed.
+    """
+    start = time.perf_counter()
+    course = catalog.course
+    requester = course._requester
+    failures = []
+
+    def attempt(label, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            failures.append(f"{label}: {e}")
+
+    def create(spec):
+        attributes = {field: value for field, value in spec.items() if field != "overrides"}
+        assignment = attempt(f"create '{spec['name']}'", course.create_assignment, attributes)
+        if assignment is None:
+            return []
+        return [dict({"assignment_id": assignment.id}, **override) for override in spec.get("overrides", ())]
+
+    def edit(assignment, changes):
+        # A date is cleared by sending it empty
+        changes = {field: "" if value is None else value for field, value in changes.items()}
+        attempt(f"update '{assignment.name}'", lambda: assignment.edit(assignment=changes))
+
+    def delete_override(assignment, override):
+        attempt(f"delete override {override.id} of '{assignment.name}'", requester.request, "DELETE",
+                f"courses/{course.id}/assignments/{assignment.id}/overrides/{override.id}")
+
+    # Canvas groups the fields of each override in a batch by where
+    # assignment_id starts it, so that goes first
+    override_creates = [dict({"assignment_id": assignment.id}, **override)
+                        for assignment, override in plan.override_creates]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        creates = [pool.submit(lambda batch: [o for i in batch for o in create(plan.creates[i])], batch)
+                   for batch in creation_batches(plan.creates)]
+        jobs = [pool.submit(edit, *item) for item in plan.edits]
+        jobs += [pool.submit(delete_override, *item) for item in plan.override_deletes]
+        jobs += [pool.submit(attempt, f"delete '{a.name}'", a.delete) for a in plan.deletes]
+        for future in creates:
+            override_creates += future.result()
+        for future in jobs:
+            future.result()
+
+    for i in range(0, len(override_creates), OVERRIDE_BATCH_SIZE):
+        batch = override_creates[i:i + OVERRIDE_BATCH_SIZE]
+        attempt(f"add overrides {i + 1}-{i + len(batch)}", lambda: list(course.create_assignment_overrides(batch)))
+
+    if plan.date_updates:
+        attempt("bulk date update", _bulk_update_dates, course, plan.date_updates)
+
+    # Anything listing this course's assignments from the cache must see the changes
+    catalog.forget("assignments")
+
+    for failure in failures:
+        print(f"  {failure}: failed")
+    print(f"{len(plan.creates)} created, {len(plan.edits) + len(plan.date_updates)} updated, "
+          f"{len(plan.deletes)} deleted, {len(override_creates)} overrides added and "
+          f"{len(plan.override_deletes)} deleted, {len(failures)} failed "
+          f"in {time.perf_counter() - start:.1f}s")
+    return len(failures)
+
+
+def _bulk_update_dates(course, date_updates):
+    # canvasapi only sends form data with PUT, and this endpoint takes a JSON array
+    requester = course._requester
+    response = requester._session.put(
+        f"{requester.base_url}courses/{course.id}/assignments/bulk_update",
+        headers={"Authorization": f"Bearer {requester.access_token}"},
+        json=[{"id": assignment.id, "all_dates": all_dates} for assignment, all_dates in date_updates])
+    if response.status_code >= 400:
+        raise RuntimeError(f"status code {response.status_code}: {response.text[:200]}")
+
+    progress = Progress(requester, response.json())
+    deadline = time.monotonic() + PROGRESS_TIMEOUT
+    while progress.workflow_state not in ("completed", "failed"):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"still {progress.workflow_state} after {PROGRESS_TIMEOUT}s")
+        time.sleep(PROGRESS_POLL_INTERVAL)
+        progress = progress.query()
+    if progress.workflow_state == "failed":
+        raise RuntimeError(getattr(progress, "message", None) or "Canvas reported it failed")
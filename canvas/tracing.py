@@ -0,0 +1,211 @@
+"""
+Records where a run's time goes: in which phase of the script, and in which
+requests to Canvas.
+
+Phases are named spans of the script (e.g. "course lookup" or "download")
+that may nest. Time spent in a nested phase is counted toward it and not
+toward its parent. Every request the rate-limit scheduler sends is recorded
+with its endpoint, page, latency, size, retry attempt and status, tagged with
+the phase and context (e.g. the assignment) of the thread that made it.
+
+Nothing is recorded until the tracer is enabled, so the hooks cost next to
+nothing in a normal run. The trace is written in the Chrome trace event
+format, which chrome://tracing and https://ui.perfetto.dev can open, with the
+raw request records and the per-phase summary alongside.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+
+class Tracer:
+    """
+    Collects phase and request records from any number of threads.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.requests = []
+        self.phases = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self):
+        """
+        Starts recording, with timestamps relative to now.
+        """
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    @contextmanager
+    def phase(self, name, **args):
+        """
+        Counts the time spent in the with-block toward the named phase.
+        Keyword arguments (e.g. assignment=...) are attached to the phase
+        and to every request made inside it.
+        """
+        if not self.enabled:
+            yield
+            return
+        frame = self._push(name, args)
+        try:
+            yield
+        finally:
+            self._pop(frame, emit=True)
+
+    def iterate(self, name, iterable, **args):
+        """
+        Yields from iterable, counting only the time spent producing each
+        item toward the named phase, e.g. the pages of a listing that is
+        consumed as it streams in.
+        """
+        iterator = iter(iterable)
+        while True:
+            frame = self._push(name, args) if self.enabled else None
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if frame is not None:
+                    self._pop(frame, emit=False)
+            yield item
+
+    def bind(self, func):
+        """
+        Returns a wrapper that runs func, on whatever thread, as if it were
+        called in the current thread's phase and context, so that requests
+        handed off to other threads are still attributed to it.
+        """
+        if not self.enabled:
+            return func
+        frames = [dict(frame, nested=0.0) for frame in self._stack()]
+
+        def bound(*args, **kwargs):
+            saved = self._stack()
+            self._local.stack = list(frames)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.stack = saved
+        return bound
+
+    def record_request(self, method, url, status, start, end, size, attempt):
+        """
+        Records one request attempt, made by the current thread.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The full URL requested.
+            status (int): The response status, or None if it failed.
+            start (float): When it was sent, from time.perf_counter().
+            end (float): When the response headers arrived.
+            size (int): The response's Content-Length, or None.
+            attempt (int): 0 for the first try, 1 for the first retry, etc.
+        """
+        if not self.enabled:
+            return
+        parsed = urlparse(url)
+        endpoint = parsed.path.split("/api/v1/", 1)[-1]
+        page = parse_qs(parsed.query).get("page", ["1"])[0]
+        stack = self._stack()
+        record = dict(self._context(), **{
+            "method": method,
+            "endpoint": endpoint,
+            "page": int(page) if page.isdigit() else page,
+            "status": status,
+            "latency": end - start,
+            "bytes": size,
+            "attempt": attempt,
+            "phase": stack[-1]["name"] if stack else None,
+        })
+        event = self._event(f"{method} {endpoint}", "request", start, end, record)
+        with self._lock:
+            self.requests.append(record)
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Returns per-phase totals: the time spent in each phase itself, how
+        often it was entered, and the requests made in it.
+        """
+        rows = {name: {"calls": calls, "seconds": seconds, "requests": 0, "retries": 0,
+                       "bytes": 0, "request_seconds": 0.0}
+                for name, (calls, seconds) in self.phases.items()}
+        for record in self.requests:
+            row = rows.setdefault(record["phase"] or "(no phase)", {
+                "calls": 0, "seconds": 0.0, "requests": 0, "retries": 0, "bytes": 0, "request_seconds": 0.0})
+            row["requests"] += 1
+            row["retries"] += record["attempt"] > 0
+            row["bytes"] += record["bytes"] or 0
+            row["request_seconds"] += record["latency"]
+        return rows
+
+    def print_summary(self):
+        """
+        Prints the per-phase summary as a table. Phases that ran on several
+        threads at once can add up to more than the wall time.
+        """
+        print(f"{'phase':<22}{'calls':>7}{'seconds':>10}{'requests':>10}{'retries':>9}"
+              f"{'MB':>9}{'avg latency':>13}")
+        for name, row in sorted(self.summary().items(), key=lambda item: -item[1]["seconds"]):
+            latency = f"{row['request_seconds'] / row['requests'] * 1000:.0f} ms" if row["requests"] else "-"
+            print(f"{name:<22}{row['calls']:>7}{row['seconds']:>10.2f}{row['requests']:>10}"
+                  f"{row['retries']:>9}{row['bytes'] / (1024 * 1024):>9.1f}{latency:>13}")
+
+    def write(self, path):
+        """
+        Writes the trace to path as Chrome trace JSON, with the request
+        records and the summary as extra top-level keys.
+        """
+        with self._lock:
+            trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                     "requests": list(self.requests), "summary": self.summary()}
+        with open(path, "w") as f:
+            json.dump(trace, f)
+
+    # --- per-thread phase stack ---
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _context(self):
+        context = {}
+        for frame in self._stack():
+            context.update(frame["args"])
+        return context
+
+    def _push(self, name, args):
+        frame = {"name": name, "args": args, "start": time.perf_counter(), "nested": 0.0}
+        self._stack().append(frame)
+        return frame
+
+    def _pop(self, frame, emit):
+        end = time.perf_counter()
+        stack = self._stack()
+        context = self._context()
+        stack.pop()
+        duration = end - frame["start"]
+        if stack:
+            stack[-1]["nested"] += duration
+        event = self._event(frame["name"], "phase", frame["start"], end, context) if emit else None
+        with self._lock:
+            calls, seconds = self.phases.get(frame["name"], (0, 0.0))
+            self.phases[frame["name"]] = (calls + 1, seconds + duration - frame["nested"])
+            if event is not None:
+                self.events.append(event)
+
+    def _event(self, name, category, start, end, args):
+        # A Chrome trace "complete" event, with times in microseconds
+        return {"name": name, "cat": category, "ph": "X", "pid": 1, "tid": threading.get_ident(),
+                "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6, "args": args}
+
+
+# The tracer every module records to
+tracer = Tracer()
@@ -1,7 +1,9 @@
 # /// script
-# requires-python = ">=3.8"
+# requires-python = ">=3.9"
 # dependencies = [
 #     "canvasapi",
+#     "numpy",
+#     "zstandard",
 # ]
 # ///
 # -*- coding: utf-8 -*-
@@ -26,10 +28,47 @@ Either install the canvasapi module and run this with python as usual, or use uv
 0.  Install uv - see https://docs.astral.sh/uv/getting-started/installation/
 1.  Run: 
       uv run studentwork.py
+
+Add --profile to see where the time goes: it prints a per-phase summary and
+writes a Chrome trace of every request and download to studentwork-trace.json
+(or the file given, as in --profile run.json).
+
+Add --watch to keep running after the download and refresh the samples as
+grading goes on: every WATCH_INTERVAL seconds (or as many as given, as in
+--watch 30) it asks Canvas only for what was graded or submitted since the
+last check, and re-downloads just the samples whose submission changed.
 """
+import argparse
+import io
+import json
 import os
-from canvasapi import Canvas
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+import requests
 from canvasapi.exceptions import CanvasException, ResourceDoesNotExist, Unauthorized
+from canvasapi.util import combine_kwargs
+
+# Helpers shared with the scripts in canvas/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "canvas"))
+from archive import ArchiveWriter  # noqa: E402
+from blobstore import DEFAULT_BLOB_STORE, BlobStore, link_file  # noqa: E402
+from downloads import CHUNK_SIZE, download_file, iter_download  # noqa: E402
+from engine import AsyncEngine  # noqa: E402
+from manifest import DownloadManifest  # noqa: E402
+from ratelimit import connect, install_scheduler  # noqa: E402
+from sampling import ScoreColumns, select_samples, write_distribution_csv  # noqa: E402
+from catalog import CourseCatalog  # noqa: E402
+from records import SubmissionRecord  # noqa: E402
+from tracing import tracer  # noqa: E402
+from listing_cache import (DEFAULT_CACHE_FILE, ListingCache,  # noqa: E402
+                           cached_graded_submissions, cached_user_submissions, iter_pages,
+                           seconds_before)
 
 # --- START CONFIGURATION ---
 
@@ -57,6 +96,64 @@ SUBMISSION_PERCENTILES = {
     "Good": 0.95       # 95th percentile
 }
 
+# Number of submissions to download per percentile, taken from around it in
+# score order. With more than one, their file names are numbered.
+SAMPLES_PER_PERCENTILE = 1
+
+# How a percentile is turned into a position among the graded submissions
+# sorted by score: "legacy" (int(n * p) - 1), or any numpy.quantile method,
+# e.g. "nearest", "lower", "higher", "linear" or "hazen". Equal scores are
+# ordered by submission time, earliest first.
+QUANTILE_METHOD = "legacy"
+
+# Write each assignment's score statistics, histogram and chosen positions
+# to grade_distribution.csv in DOWNLOAD_DIR
+WRITE_DISTRIBUTION_CSV = True
+
+# Number of attachments to download at the same time. All workers share one
+# keep-alive connection pool, so this is also the number of open connections.
+DOWNLOAD_WORKERS = 8
+
+# Number of assignments whose submissions are listed and sampled at the same time
+ASSIGNMENT_WORKERS = 4
+
+# Every attachment of a sample is downloaded, largest first. Attachments over
+# MAX_ATTACHMENT_MB are left out, and so is whatever no longer fits in a run's
+# DOWNLOAD_BUDGET_MB of new downloads (shared by all its --watch refreshes);
+# each is listed in its sample's comment report instead. 0 means no limit.
+MAX_ATTACHMENT_MB = 0
+DOWNLOAD_BUDGET_MB = 0
+
+# Course, assignment and submission listings are cached here between runs.
+# With OFFLINE = True they are all read from the cache and Canvas is never
+# called: only attachments already in DOWNLOAD_DIR or the blob store are
+# saved, and the others are listed in their samples' comment reports.
+CACHE_FILE = DEFAULT_CACHE_FILE
+OFFLINE = False
+
+# Attachments are downloaded once into this content-addressed store, shared
+# by every run and course, and DOWNLOAD_DIR gets hard links (or reflinks, or
+# copies) of them. Leave empty to download straight into DOWNLOAD_DIR.
+# Run `studentwork.py --gc` to delete what no download directory uses any more.
+BLOB_STORE = DEFAULT_BLOB_STORE
+
+# Instead of a folder tree in DOWNLOAD_DIR, stream everything into this one
+# archive (ending in .zip or .tar.zst; the latter needs the zstandard
+# package), with the same layout inside. Leave empty to save files as usual.
+OUTPUT_ARCHIVE = ""
+
+# Seconds between checks for newly graded or submitted work with --watch
+WATCH_INTERVAL = 60
+
+# Each check looks this many seconds further back than the newest timestamp
+# seen, since Canvas timestamps only go to the second and work graded in that
+# same second may not have been listed yet
+WATCH_OVERLAP = 2
+
+# Also write every sampled submission's comments to DOWNLOAD_DIR/sampled_comments.jsonl,
+# one JSON object per sample, replacing the file from the previous run
+EXPORT_COMMENTS_JSONL = False
+
 # --- END CONFIGURATION ---
 
 
@@ -67,214 +164,868 @@ def sanitize_filename(name):
     return "".join(c for c in name if c.isalnum() or c in (' ', '.', '_')).rstrip()
 
 
-def download_submission_examples(canvas, course_id, assignment_names):
+# Serializes console output so each worker's report for a file stays together
+_print_lock = threading.Lock()
+
+
+def score_percent(assignment, submission):
     """
-    Main function to process assignments and download submission examples.
+    Returns the assignment's points possible (100 if unset) and the
+    submission's score as a percentage of it, rounded to one decimal.
+    """
+    max_points = assignment.points_possible if hasattr(assignment, 'points_possible') and assignment.points_possible else 100
+    percent_score = round((submission.score / max_points) * 100, 1) if submission.score and max_points else 0
+    return max_points, percent_score
+
+
+def format_comment_report(assignment, submission, max_points, percent_score, skipped=()):
+    """
+    Renders the comment report saved next to a sample as a single string,
+    listing after its header the attachments in skipped, (attachment,
+    reason) pairs, that were not downloaded.
+    """
+    lines = [
+        f"Assignment: {assignment.name}",
+        f"Student Score: {submission.score}/{max_points} ({percent_score}%)",
+        f"Submission ID: {submission.id}",
+        "=" * 50,
+        "",
+    ]
+    if skipped:
+        lines.append("Attachments not downloaded:")
+        lines += [f"- {attachment.filename} ({size_label(getattr(attachment, 'size', None))}): {reason}"
+                  for attachment, reason in skipped]
+        lines += ["-" * 30, ""]
+    comments = getattr(submission, 'submission_comments', None) or []
+    for i, comment in enumerate(comments, 1):
+        lines += [
+            f"Comment {i}:",
+            f"Author: {comment.get('author_name', 'Unknown')}",
+            f"Date: {comment.get('created_at', 'Unknown')}",
+            f"Comment: {comment.get('comment', 'No comment text')}",
+            "-" * 30,
+            "",
+        ]
+    if not comments:
+        lines.append("No comments found for this submission.")
+    return "\n".join(lines) + "\n"
+
+
+def export_comments_jsonl(download_jobs, jsonl_file):
+    """
+    Writes the comments of every sampled submission as JSONL, one object per
+    (assignment, percentile folder) sample.
 
     Args:
-        canvas (Canvas): An initialized Canvas API object.
-        course_id (int): The ID of the target course.
-        assignment_names (list): A list of assignment names to process.
+        download_jobs (list): (assignment, quantile_label, sample, submission) tuples.
+        jsonl_file (file): The text file to write to.
     """
-    print(f"Starting submission download process for Course ID: {course_id}")
+    for assignment, quantile_label, sample, submission in download_jobs:
+        max_points, percent_score = score_percent(assignment, submission)
+        record = {
+            "assignment": assignment.name,
+            "assignment_id": assignment.id,
+            "folder": quantile_label,
+            "sample": sample + 1,
+            "submission_id": submission.id,
+            "user_id": submission.user_id,
+            "score": submission.score,
+            "points_possible": max_points,
+            "percent_score": percent_score,
+            "comments": [
+                {key: comment.get(key) for key in ("author_name", "created_at", "comment")}
+                for comment in getattr(submission, 'submission_comments', None) or []
+            ],
+        }
+        jsonl_file.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def output_file(archive, name):
+    """
+    Opens a text file to write in DOWNLOAD_DIR, or, with an archive, one
+    that is added to the archive when the block ends.
+    """
+    if archive is None:
+        with open(os.path.join(DOWNLOAD_DIR, name), 'w', encoding='utf-8', newline='') as f:
+            yield f
+    else:
+        f = io.StringIO(newline='')
+        yield f
+        archive.add(name, f.getvalue().encode('utf-8'))
+
 
+def collect_scores(course, cache, assignment, track_versions=False):
+    """
+    Reads the scores of one assignment's graded submissions. Runs on an
+    engine worker thread, alongside the other assignments.
+
+    Args:
+        course (Course): The course the assignment belongs to.
+        cache (ListingCache): The listing cache to read through.
+        assignment (Assignment): The assignment to sample.
+        track_versions (bool): Keep the version of every submission listed,
+            for `watch_samples` (see `ScoreColumns`).
+
+    Returns:
+        ScoreColumns: The graded submissions with files (possibly too few to
+        select percentiles from yet), or None if they couldn't be listed.
+    """
+    log = ["\n" + "="*50, f"Processing Assignment: {assignment.name}"]
+    columns = None
     try:
-        # Get the course object from Canvas
-        course = canvas.get_course(course_id)
-        print(f"Successfully connected to course: '{course.name}'")
+        # Ask Canvas (or the cache) only for graded submissions, without the
+        # user and comment payloads, and keep just their scores as the
+        # pages stream in.
+        with tracer.phase("selection", assignment=assignment.name):
+            listed = ScoreColumns(assignment, track_versions)
+            for submission in tracer.iterate("submission listing",
+                                             cached_graded_submissions(course, cache, assignment)):
+                listed.add(submission)
+        columns = listed
 
-        # Create the base download directory if it doesn't exist
-        if not os.path.exists(DOWNLOAD_DIR):
-            os.makedirs(DOWNLOAD_DIR)
-            print(f"Created base download directory: '{DOWNLOAD_DIR}'")
+        n = len(columns)
+        if n < len(SUBMISSION_PERCENTILES):
+            log.append(f"Warning: Found only {n} graded submissions with files. "
+                       f"At least {len(SUBMISSION_PERCENTILES)} are required to select percentiles.")
+            log.append(f"Skipping download for assignment '{assignment.name}'.")
+        else:
+            log.append(f"Found {n} graded submissions with files.")
 
-    except Unauthorized:
-        print(f"Error: Unauthorized. Please check your API_KEY for Course ID {course_id}.")
-        return
     except ResourceDoesNotExist:
-        print(f"Error: Course with ID {course_id} was not found. Please check your COURSE_ID.")
-        return
+        log.append(f"Error: Assignment '{assignment.name}' not found in this course.")
+    except CanvasException as e:
+        log.append(f"An API error occurred while processing assignment '{assignment.name}': {e}")
     except Exception as e:
-        print(f"An unexpected error occurred while accessing the course: {e}")
-        return
+        log.append(f"An unexpected error occurred for assignment '{assignment.name}': {e}")
+    finally:
+        with _print_lock:
+            print("\n".join(log))
 
-    # Get all assignments for the course
+    return columns
+
+
+def fetch_samples(course, cache, selection):
+    """
+    Fetches the submissions chosen for one assignment, with their comments.
+    Runs on an engine worker thread, alongside the other assignments.
+
+    Args:
+        course (Course): The course the assignment belongs to.
+        cache (ListingCache): The listing cache to read through.
+        selection (Selection): The assignment's chosen samples.
+
+    Returns:
+        list: (assignment, quantile_label, sample, submission) download jobs.
+    """
+    assignment = selection.assignment
+    download_jobs = []
     try:
-        all_assignments = list(course.get_assignments())
-        print(f"Found {len(all_assignments)} total assignments in the course")
+        # Fetch the full submissions, with their comments, for all of the
+        # chosen users in one listing
+        user_ids = {user_id for users in selection.samples.values() for user_id in users}
+        with tracer.phase("comments", assignment=assignment.name):
+            winners = {sub.user_id: sub for sub in cached_user_submissions(
+                course, cache, assignment, user_ids, include=["submission_comments"])}
+
+        for quantile_label, users in selection.samples.items():
+            for sample, user_id in enumerate(users):
+                if user_id in winners:
+                    download_jobs.append((assignment, quantile_label, sample, winners[user_id]))
+        message = f"'{assignment.name}': identified {len(download_jobs)} submission examples to download."
+    except CanvasException as e:
+        message = f"An API error occurred while fetching samples of assignment '{assignment.name}': {e}"
     except Exception as e:
-        print(f"Error retrieving assignments: {e}")
-        return
+        message = f"An unexpected error occurred for assignment '{assignment.name}': {e}"
+
+    with _print_lock:
+        print(message)
+    return download_jobs
+
+
+def sample_file_names(assignment, quantile_label, sample, submission):
+    """
+    Returns a sample's manifest slot, the names of its attachment files and
+    the name of its comment report, e.g. "Lab 1_86.7.py" and "Lab 1_86.7.txt".
+    A sample with several attachments gets each one's own name appended,
+    as in "Lab 5_86.7_turtle.py" and "Lab 5_86.7_drawing.png".
+    """
+    # Create new filename: {assignment_name}_{percent_score}.{extension}
+    _, percent_score = score_percent(assignment, submission)
+    base_name = f"{sanitize_filename(assignment.name)}_{percent_score}"
+    slot = f"{quantile_label}/{assignment.id}"
+    # Several samples of one percentile are told apart by number
+    if SAMPLES_PER_PERCENTILE > 1:
+        base_name += f"_{sample + 1}"
+        slot += f"/{sample + 1}"
+    attachments = submission.attachments
+    if len(attachments) == 1:
+        file_names = [base_name + os.path.splitext(attachments[0].filename)[1]]
+    else:
+        file_names = []
+        for attachment in attachments:
+            stem, file_extension = os.path.splitext(attachment.filename)
+            file_name = f"{base_name}_{sanitize_filename(stem)}{file_extension}"
+            # Two uploads can share a name
+            if file_name in file_names:
+                file_name = f"{base_name}_{sanitize_filename(stem)}_{attachment.id}{file_extension}"
+            file_names.append(file_name)
+    return slot, file_names, base_name + ".txt"
 
-    # Filter assignments by name
-    assignments_to_process = []
-    for assignment_name in assignment_names:
-        found = False
-        for assignment in all_assignments:
-            if assignment.name == assignment_name:
-                assignments_to_process.append(assignment)
-                found = True
-                break
-        if not found:
-            print(f"Warning: Assignment '{assignment_name}' not found in course")
 
-    if not assignments_to_process:
-        print("Error: No matching assignments found. Please check your assignment names.")
+def size_label(size):
+    """
+    Returns an attachment size in bytes as e.g. "3.2 MB", or "unknown size".
+    """
+    if size is None:
+        return "unknown size"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def plan_downloads(download_jobs, manifest=None, store=None, budget=None, offline=False):
+    """
+    Decides which attachments of the queued samples to download, and in
+    which order.
+
+    Attachments that are already saved (per the manifest) or in the blob
+    store cost nothing. Of the rest, all are left out when offline, those
+    over MAX_ATTACHMENT_MB are left out, and the others are charged against the budget in sample order,
+    leaving out each one that no longer fits. The attachments to
+    fetch are then ordered by size, largest first, so the big ones start
+    right away instead of trailing behind everything else.
+
+    Args:
+        download_jobs (list): (assignment, quantile_label, sample, submission) tuples.
+        manifest (DownloadManifest): The manifest of DOWNLOAD_DIR, if saving there.
+        store (BlobStore): The blob store, if any.
+        budget (int): The bytes the run may still download, or None for no limit.
+        offline (bool): Whether Canvas is out of reach, so only attachments
+            already saved or stored can be used.
+
+    Returns:
+        tuple: (tasks, skipped). tasks is a list of (job index, slot,
+        attachment, file name, "current", "stored" or "download") tuples,
+        largest attachment first. skipped maps a job index to the
+        (attachment, reason) pairs of the attachments left out.
+    """
+    max_size = MAX_ATTACHMENT_MB * 1024 * 1024
+    tasks = []
+    skipped = {}
+    for index, (assignment, quantile_label, sample, submission) in enumerate(download_jobs):
+        slot, file_names, _ = sample_file_names(assignment, quantile_label, sample, submission)
+        for attachment, file_name in zip(submission.attachments, file_names):
+            # Canvas doesn't always report a size; those count as empty
+            size = getattr(attachment, 'size', None) or 0
+            rel_path = os.path.join(quantile_label, file_name)
+            if manifest is not None and manifest.is_current(rel_path, submission, attachment):
+                status = "current"
+            elif store is not None and store.lookup(attachment)[0] is not None:
+                status = "stored"
+            elif offline:
+                skipped.setdefault(index, []).append((attachment, "not available offline"))
+                continue
+            elif MAX_ATTACHMENT_MB and size > max_size:
+                skipped.setdefault(index, []).append(
+                    (attachment, f"larger than the {MAX_ATTACHMENT_MB:g} MB limit per file"))
+                continue
+            elif budget is not None and size > budget:
+                skipped.setdefault(index, []).append(
+                    (attachment, f"over this run's {DOWNLOAD_BUDGET_MB:g} MB download budget"))
+                continue
+            else:
+                status = "download"
+                if budget is not None:
+                    budget -= size
+            tasks.append((index, slot, attachment, file_name, status))
+    tasks.sort(key=lambda task: getattr(task[2], 'size', None) or 0, reverse=True)
+    return tasks, skipped
+
+
+def archive_attachment(assignment, quantile_label, attachment, file_name, archive, store=None):
+    """
+    Streams one attachment of a selected submission into the archive, chunk
+    by chunk, under the name it would have in DOWNLOAD_DIR. Runs on a
+    download worker thread.
+
+    Args:
+        assignment (Assignment): The assignment the submission belongs to.
+        quantile_label (str): The SUBMISSION_PERCENTILES folder to save into.
+        attachment (AttachmentRecord): The attachment.
+        file_name (str): Its name in the folder.
+        archive (ArchiveWriter): The archive to add it to.
+        store (BlobStore): Where to take the attachment from instead of
+            Canvas, if it is there.
+
+    Returns:
+        tuple: ("downloaded", "linked" (from the blob store) or "failed",
+        number of bytes downloaded).
+    """
+    name = f"{quantile_label}/{file_name}"
+    size = getattr(attachment, 'size', None)
+    try:
+        blob_path = store.lookup(attachment)[0] if store is not None else None
+        if blob_path is not None:
+            with open(blob_path, 'rb') as blob, archive.open(name, os.path.getsize(blob_path)) as entry:
+                for chunk in iter(lambda: blob.read(CHUNK_SIZE), b""):
+                    entry.write(chunk)
+            result = ("linked", 0)
+        else:
+            chunks = iter_download(assignment._requester, attachment.url, expected_size=size)
+            with tracer.phase("download", assignment=assignment.name, sample=quantile_label):
+                if size is None:
+                    # A tar header needs the size up front; Canvas nearly always reports it
+                    body = b"".join(chunks)
+                    archive.add(name, body)
+                    downloaded_bytes = len(body)
+                else:
+                    downloaded_bytes = 0
+                    with archive.open(name, size) as entry:
+                        for chunk in chunks:
+                            entry.write(chunk)
+                            downloaded_bytes += len(chunk)
+            result = ("downloaded", downloaded_bytes)
+        message = f"  -> Added '{file_name}' to {quantile_label} folder of the archive"
+
+    except CanvasException as e:
+        message = f"     Error: Could not download '{attachment.filename}' ({attachment.id}). Reason: {e}"
+        result = ("failed", 0)
+    except Exception as e:
+        message = f"     An unexpected error occurred during download: {e}"
+        result = ("failed", 0)
+
+    with _print_lock:
+        print(message)
+    return result
+
+
+def save_attachment(assignment, quantile_label, submission, slot, attachment, file_name, status,
+                    manifest, store=None):
+    """
+    Saves one attachment of a selected submission in its percentile folder.
+    Runs on a download worker thread.
+
+    Args:
+        assignment (Assignment): The assignment the submission belongs to.
+        quantile_label (str): The SUBMISSION_PERCENTILES folder to save into.
+        submission (SubmissionRecord): The selected submission.
+        slot (str): The sample's manifest slot.
+        attachment (AttachmentRecord): The attachment.
+        file_name (str): Its name in the folder.
+        status (str): What `plan_downloads` found: "current" if it is
+            already on disk intact, "stored" or "download".
+        manifest (DownloadManifest): The manifest of DOWNLOAD_DIR.
+        store (BlobStore): The blob store to download through and link
+            from, if any.
+
+    Returns:
+        tuple: ("downloaded", "linked" (from the blob store), "skipped" or
+        "failed", number of bytes downloaded).
+    """
+    log = []
+    result = ("failed", 0)
+    try:
+        # Create the quantile-specific directory. Workers may race to create
+        # the same folder, so an existing one is not an error.
+        quantile_dir = os.path.join(DOWNLOAD_DIR, quantile_label)
+        os.makedirs(quantile_dir, exist_ok=True)
+        file_path = os.path.join(quantile_dir, file_name)
+
+        rel_path = os.path.join(quantile_label, file_name)
+        if status == "current":
+            log.append(f"  -> '{file_name}' in {quantile_label} folder is already up to date")
+            result = ("skipped", 0)
+        else:
+            log.append(f"  -> Downloading '{file_name}' ({size_label(getattr(attachment, 'size', None))}) "
+                       f"to {quantile_label} folder...")
+            with tracer.phase("download", assignment=assignment.name, sample=quantile_label):
+                if store is None:
+                    downloaded_bytes, sha256 = download_file(assignment._requester, attachment.url, file_path,
+                                                             expected_size=getattr(attachment, 'size', None),
+                                                             tag=attachment.id)
+                else:
+                    blob_path, sha256, downloaded_bytes = store.fetch(assignment._requester, attachment)
+                    how = link_file(blob_path, file_path)
+            manifest.record(rel_path, slot, submission, attachment, sha256=sha256)
+            if store is not None and not downloaded_bytes:
+                result = ("linked", 0)
+                log.append(f"     Already in the blob store, {how} saved to '{file_path}'")
+            else:
+                result = ("downloaded", downloaded_bytes)
+                log.append(f"     Success! Saved to '{file_path}'")
+
+    except CanvasException as e:
+        log.append(f"     Error: Could not download file for submission ID {submission.id}. Reason: {e}")
+    except Exception as e:
+        log.append(f"     An unexpected error occurred during download: {e}")
+    finally:
+        with _print_lock:
+            print("\n".join(log))
+
+    return result
+
+
+def save_report(assignment, quantile_label, sample, submission, skipped, manifest=None, archive=None):
+    """
+    Writes a sample's comment report, listing the attachments that were left
+    out, once all of its other attachments are done. In DOWNLOAD_DIR it also
+    removes whatever a previously selected submission left in the sample's
+    slot. Runs on the main thread.
+
+    Args:
+        assignment (Assignment): The assignment the submission belongs to.
+        quantile_label (str): The SUBMISSION_PERCENTILES folder to save into.
+        sample (int): Which of the percentile's SAMPLES_PER_PERCENTILE samples it is.
+        submission (SubmissionRecord): The selected submission.
+        skipped (list): (attachment, reason) pairs from `plan_downloads`.
+        manifest (DownloadManifest): The manifest of DOWNLOAD_DIR, if saving there.
+        archive (ArchiveWriter): The archive to add the report to instead.
+    """
+    log = []
+    try:
+        slot, file_names, comment_file_name = sample_file_names(assignment, quantile_label, sample, submission)
+        max_points, percent_score = score_percent(assignment, submission)
+        report = format_comment_report(assignment, submission, max_points, percent_score, skipped)
+        for attachment, reason in skipped:
+            log.append(f"  -> Not downloading '{attachment.filename}' "
+                       f"({size_label(getattr(attachment, 'size', None))}): {reason}")
+
+        if archive is not None:
+            archive.add(f"{quantile_label}/{comment_file_name}", report.encode('utf-8'))
+            log.append(f"  -> Added '{comment_file_name}' to {quantile_label} folder of the archive")
+            return
+
+        # Write the comment report for this submission
+        quantile_dir = os.path.join(DOWNLOAD_DIR, quantile_label)
+        os.makedirs(quantile_dir, exist_ok=True)
+        comment_file_path = os.path.join(quantile_dir, comment_file_name)
+        with tracer.phase("comments", assignment=assignment.name, sample=quantile_label):
+            with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
+                comment_file.write(report)
+        if getattr(submission, 'submission_comments', None):
+            log.append(f"     Comments saved to '{comment_file_path}'")
+        else:
+            log.append(f"     No comments found, empty comment file saved to '{comment_file_path}'")
+
+        comment_rel_path = os.path.join(quantile_label, comment_file_name)
+        manifest.record(comment_rel_path, slot, submission)
+
+        # Clear out whatever a previously selected submission left in this
+        # slot, and any attachment that has just been left out
+        left_out = {attachment.id for attachment, _ in skipped}
+        keep = {os.path.join(quantile_label, file_name)
+                for attachment, file_name in zip(submission.attachments, file_names)
+                if attachment.id not in left_out}
+        for stale_path in manifest.prune_slot(slot, keep | {comment_rel_path}):
+            log.append(f"     Removed outdated sample '{stale_path}'")
+
+    except Exception as e:
+        log.append(f"     An unexpected error occurred while saving comments of submission ID {submission.id}: {e}")
+    finally:
+        with _print_lock:
+            print("\n".join(log))
+
+
+def download_all(requester, download_jobs, workers, archive=None, budget=None, offline=False):
+    """
+    Downloads every attachment of the queued samples on a bounded pool of
+    worker threads, largest first (see `plan_downloads`), writes each
+    sample's comment report once its attachments are done and prints a
+    throughput summary at the end.
+
+    Args:
+        requester (Requester): The canvasapi requester shared by all workers.
+            Its scheduler's connection pool is grown to fit them if needed.
+        download_jobs (list): (assignment, quantile_label, sample, submission) tuples.
+        workers (int): The maximum number of concurrent downloads.
+        archive (ArchiveWriter): The archive to add the samples to, instead
+            of saving them in DOWNLOAD_DIR.
+        budget (int): The bytes the run may still download, or None for no limit.
+        offline (bool): Whether to leave out everything not already saved or
+            in the blob store, as in OFFLINE mode.
+
+    Returns:
+        int: The bytes the run may still download after this, or None.
+    """
+    store = BlobStore(BLOB_STORE) if BLOB_STORE else None
+    manifest = None
+    if archive is None:
+        manifest = DownloadManifest(DOWNLOAD_DIR)
+        if store is not None:
+            store.add_root(DOWNLOAD_DIR)
+    tasks, skipped = plan_downloads(download_jobs, manifest, store, budget, offline)
+    workers = max(1, min(workers, len(tasks)))
+    install_scheduler(requester, workers)
+    if archive is None:
+        print(f"Downloading {len(tasks)} attachments of {len(download_jobs)} submission examples "
+              f"with {workers} workers...")
+    else:
+        print(f"Downloading {len(tasks)} attachments of {len(download_jobs)} submission examples "
+              f"into '{archive.path}' with {workers} workers...")
+
+    start = time.perf_counter()
+    counts = {"downloaded": 0, "linked": 0, "skipped": 0, "failed": 0}
+    total_bytes = 0
+    # Attachments still to finish per sample; its report is written at zero
+    pending = Counter(task[0] for task in tasks)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for index, slot, attachment, file_name, status in tasks:
+            assignment, quantile_label, _, submission = download_jobs[index]
+            if archive is None:
+                future = pool.submit(save_attachment, assignment, quantile_label, submission, slot,
+                                     attachment, file_name, status, manifest, store)
+            else:
+                future = pool.submit(archive_attachment, assignment, quantile_label, attachment,
+                                     file_name, archive, store)
+            futures[future] = index
+        # Samples with nothing to download only need their report
+        for index, job in enumerate(download_jobs):
+            if not pending[index]:
+                save_report(*job, skipped.get(index, []), manifest, archive)
+        for future in as_completed(futures):
+            status, downloaded_bytes = future.result()
+            counts[status] += 1
+            total_bytes += downloaded_bytes
+            index = futures[future]
+            pending[index] -= 1
+            if not pending[index]:
+                save_report(*download_jobs[index], skipped.get(index, []), manifest, archive)
+    elapsed = max(time.perf_counter() - start, 1e-6)
+
+    files = counts["downloaded"]
+    megabytes = total_bytes / (1024 * 1024)
+    left_out = sum(len(pairs) for pairs in skipped.values())
+    print(f"Downloaded {files}/{len(tasks)} files ({megabytes:.1f} MB) in {elapsed:.1f}s: "
+          f"{files / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s")
+    if archive is None:
+        print(f"{counts['skipped']} already up to date, {counts['linked']} linked from the blob store, "
+              f"{counts['failed']} failed (failed files are retried on the next run)")
+    else:
+        print(f"{counts['linked']} taken from the blob store, {counts['failed']} failed "
+              f"(and left out of a .zip, or marked .incomplete in a .tar.zst)")
+    if left_out:
+        print(f"{left_out} attachments over MAX_ATTACHMENT_MB or DOWNLOAD_BUDGET_MB, or not available "
+              f"offline, were not downloaded (they are listed in their samples' comment reports)")
+    return None if budget is None else max(0, budget - total_bytes)
+
+
+def poll_changes(course, watermarks, seen):
+    """
+    Asks Canvas for the submissions to the watched assignments that were
+    graded or submitted since their watermarks, with their comments.
+
+    All the assignments are checked with one listing per kind of change,
+    starting WATCH_OVERLAP seconds before the oldest of their watermarks.
+    Whatever an assignment had already seen is left out: anything older than
+    its watermark minus the overlap, and any version of a submission (by id,
+    times and score) that an earlier check returned. The listing covered
+    every assignment, so afterwards they all move up to the newest timestamp
+    in it (or the newest watermark). Once they have caught up with each
+    other, a check that finds nothing costs two requests, however many
+    assignments are watched.
+
+    Args:
+        course (Course): The course the assignments belong to.
+        watermarks (dict): {assignment id: {"graded_at": ..., "submitted_at": ...}},
+            the Canvas timestamps seen last, updated in place once the
+            check completes.
+        seen (dict): {submission id: version} of the submissions returned
+            within the overlap, updated in place once the check completes.
+
+    Returns:
+        dict: The changed submissions, as SubmissionRecords, by (assignment
+        id, user id).
+    """
+    endpoint = f"courses/{course.id}/students/submissions"
+    changed = {}
+    # Worked on as copies, so a check cut short by an error is simply repeated
+    moved = {assignment_id: dict(marks) for assignment_id, marks in watermarks.items()}
+    now_seen = dict(seen)
+    for field, since in (("graded_at", "graded_since"), ("submitted_at", "submitted_since")):
+        oldest = min(marks[field] for marks in moved.values())
+        newest = max(marks[field] for marks in moved.values())
+        params = combine_kwargs(assignment_ids=sorted(watermarks), student_ids=["all"],
+                                include=["submission_comments"], per_page=100,
+                                **{since: seconds_before(oldest, WATCH_OVERLAP)})
+        for page in iter_pages(course._requester, endpoint, params):
+            for attributes in page:
+                value = attributes.get(field) or ""
+                marks = moved.get(attributes.get("assignment_id"))
+                if marks is None or value < seconds_before(marks[field], WATCH_OVERLAP):
+                    continue
+                version = tuple(attributes.get(key) for key in ("graded_at", "submitted_at", "score"))
+                if now_seen.get(attributes["id"]) == version:
+                    continue
+                now_seen[attributes["id"]] = version
+                submission = SubmissionRecord.from_json(attributes)
+                changed[(submission.assignment_id, submission.user_id)] = submission
+                newest = max(newest, value)
+        for marks in moved.values():
+            marks[field] = newest
+
+    # Versions from before the next check's overlap can't come back
+    cutoffs = [seconds_before(next(iter(moved.values()))[field], WATCH_OVERLAP)
+               for field in ("graded_at", "submitted_at")]
+    watermarks.update(moved)
+    seen.clear()
+    seen.update((submission_id, version) for submission_id, version in now_seen.items()
+                if not all((value or "") < cutoff for value, cutoff in zip(version, cutoffs)))
+    return changed
+
+
+def watch_samples(course, columns, download_jobs, interval, polls=None, budget=None):
+    """
+    Keeps the samples in DOWNLOAD_DIR in step with grading, checking every
+    interval seconds until interrupted with Ctrl+C.
+
+    Each check lists only the submissions graded or submitted since the
+    newest one seen for each assignment (see `poll_changes`), folds them
+    into the score columns and selects the samples again. A sample is
+    downloaded again only when its folder now gets a different submission,
+    or its submission itself changed (e.g. it was regraded); the grade
+    distribution and comment export are rewritten whenever anything changed.
+
+    Args:
+        course (Course): The course the assignments belong to.
+        columns (list): ScoreColumns of every watched assignment, as
+            collected by the first run.
+        download_jobs (list): The (assignment, quantile_label, sample,
+            submission) jobs the first run downloaded.
+        interval (float): Seconds between checks.
+        polls (int): How many checks to make; by default until interrupted.
+        budget (int): The bytes the run may still download, or None for no limit.
+    """
+    if not columns:
+        print("No assignments to watch.")
         return
 
-    print(f"Found {len(assignments_to_process)} assignments to process")
+    # Assignments without any graded or submitted work yet are checked from now on
+    started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    watermarks = {c.assignment.id: {field: value or started for field, value in c.newest.items()}
+                  for c in columns}
+    # What the first run listed was seen already, overlap or not
+    seen = {}
+    for c in columns:
+        seen.update(c.versions or {})
+    by_id = {c.assignment.id: c for c in columns}
+    selected = {(assignment.id, label, sample): (assignment, label, sample, submission)
+                for assignment, label, sample, submission in download_jobs}
+
+    print(f"Watching {len(columns)} assignments for grading changes every {interval:g}s (Ctrl+C to stop)...")
+    try:
+        poll = 0
+        while polls is None or poll < polls:
+            poll += 1
+            time.sleep(interval)
+            try:
+                with tracer.phase("watch poll"):
+                    changed = poll_changes(course, watermarks, seen)
+            except CanvasException as e:
+                print(f"[{time.strftime('%H:%M:%S')}] An API error occurred while checking for changes: {e}")
+                continue
+            except requests.RequestException as e:
+                print(f"[{time.strftime('%H:%M:%S')}] Could not reach Canvas to check for changes: {e}")
+                continue
+            if not changed:
+                continue
+
+            for submission in changed.values():
+                by_id[submission.assignment_id].update(submission)
+            with tracer.phase("selection"):
+                selections = select_samples([c for c in columns if len(c) >= len(SUBMISSION_PERCENTILES)],
+                                            SUBMISSION_PERCENTILES, SAMPLES_PER_PERCENTILE, QUANTILE_METHOD)
+            jobs = refresh_jobs(course, selections, selected, changed)
+            print(f"[{time.strftime('%H:%M:%S')}] {len(changed)} submissions graded or submitted, "
+                  f"{len(jobs)} samples to refresh")
+
+            if jobs:
+                budget = download_all(course._requester, jobs, DOWNLOAD_WORKERS, budget=budget)
+                for job in jobs:
+                    selected[job[0].id, job[1], job[2]] = job
+            if WRITE_DISTRIBUTION_CSV and selections:
+                with output_file(None, "grade_distribution.csv") as f:
+                    write_distribution_csv(selections, f)
+            if EXPORT_COMMENTS_JSONL:
+                with output_file(None, "sampled_comments.jsonl") as f:
+                    export_comments_jsonl(list(selected.values()), f)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
 
-    # Process each assignment found
-    for assignment in assignments_to_process:
-        print("\n" + "="*50)
-        print(f"Processing Assignment: {assignment.name}")
 
+def refresh_jobs(course, selections, selected, changed):
+    """
+    Returns the download jobs for the samples whose submission differs from
+    the one downloaded last, fetching the full submissions of users chosen
+    for the first time.
+
+    Args:
+        course (Course): The course the assignments belong to.
+        selections (list): The new Selections.
+        selected (dict): The last job of each (assignment id, label, sample).
+        changed (dict): The submissions that changed, by (assignment id, user id).
+    """
+    jobs = []
+    for selection in selections:
+        assignment = selection.assignment
+        new_users = {}
+        for label, users in selection.samples.items():
+            for sample, user_id in enumerate(users):
+                submission = changed.get((assignment.id, user_id))
+                previous = selected.get((assignment.id, label, sample))
+                if submission is not None:
+                    jobs.append((assignment, label, sample, submission))
+                elif previous is None or previous[3].user_id != user_id:
+                    new_users[(label, sample)] = user_id
+        if not new_users:
+            continue
+
+        # Comments only come with a listing of the users' full submissions
+        params = combine_kwargs(assignment_ids=[assignment.id], student_ids=sorted(set(new_users.values())),
+                                include=["submission_comments"], per_page=100)
         try:
-            print(f"Found assignment: '{assignment.name}'")
-
-            # Get all submissions for the assignment. We include the user object
-            # to get student names for file naming.
-            submissions = list(assignment.get_submissions(include=["user", "submission_comments"]))
-
-            # Filter for graded submissions that have attachments and a valid score
-            graded_submissions = []
-            for sub in submissions:
-                if (hasattr(sub, 'score') and sub.score is not None and
-                        hasattr(sub, 'attachments') and sub.attachments):
-                    graded_submissions.append(sub)
-
-            if len(graded_submissions) < len(SUBMISSION_PERCENTILES):
-                print(f"Warning: Found only {len(graded_submissions)} graded submissions with files. "
-                      f"At least {len(SUBMISSION_PERCENTILES)} are required to select percentiles.")
-                print(f"Skipping download for assignment '{assignment.name}'.")
-                continue
+            fetched = {attributes["user_id"]: SubmissionRecord.from_json(attributes)
+                       for page in iter_pages(course._requester, f"courses/{course.id}/students/submissions", params)
+                       for attributes in page}
+        except CanvasException as e:
+            print(f"An API error occurred while fetching samples of assignment '{assignment.name}': {e}")
+            continue
+        except requests.RequestException as e:
+            print(f"Could not reach Canvas to fetch samples of assignment '{assignment.name}': {e}")
+            continue
+        for (label, sample), user_id in new_users.items():
+            if user_id in fetched:
+                jobs.append((assignment, label, sample, fetched[user_id]))
+    return jobs
+
+
+def download_submission_examples(canvas, course_id, assignment_names, cache=None,
+                                 watch_interval=None, watch_polls=None):
+    """
+    Main function to process assignments and download submission examples.
+
+    Args:
+        canvas (Canvas): An initialized Canvas API object.
+        course_id (int): The ID of the target course.
+        assignment_names (list): A list of assignment names to process.
+        cache (ListingCache): The listing cache to read through. Defaults to
+            one opened on CACHE_FILE.
+        watch_interval (float): If given, keep refreshing the samples every
+            this many seconds afterwards (see `watch_samples`).
+        watch_polls (int): How often to check before returning when
+            watching; by default until interrupted.
+    """
+    print(f"Starting submission download process for Course ID: {course_id}")
+    if cache is None:
+        cache = ListingCache(CACHE_FILE, offline=OFFLINE)
+
+    if watch_interval is not None and (OUTPUT_ARCHIVE or cache.offline):
+        print("Error: watching for grading changes needs Canvas and DOWNLOAD_DIR, "
+              "so it can't be combined with OFFLINE or OUTPUT_ARCHIVE.")
+        return
+
+    archive = None
+    if OUTPUT_ARCHIVE:
+        try:
+            archive = ArchiveWriter(OUTPUT_ARCHIVE)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
+    # Listings are read through an event loop that fetches their pages concurrently
+    with AsyncEngine(ASSIGNMENT_WORKERS) as engine:
+        cache.page_fetcher = engine.page_fetcher
+        try:
+            # Get the course object from Canvas, or from the cache
+            with tracer.phase("course lookup"):
+                catalog = CourseCatalog.load(canvas, course_id, cache)
+            course = catalog.course
+            scheduler = install_scheduler(course._requester)
+            print(f"Successfully connected to course: '{course.name}'")
 
-            # Sort the submissions by score in ascending order
-            graded_submissions.sort(key=lambda s: s.score)
-
-            # Calculate percentile indices based on configuration
-            n = len(graded_submissions)
-            quantile_submissions = {}
-            
-            for label, percentile in SUBMISSION_PERCENTILES.items():
-                percentile_idx = max(0, int(n * percentile) - 1)
-                quantile_submissions[label] = graded_submissions[percentile_idx]
-
-            print(f"Identified {len(quantile_submissions)} submission examples to download.")
-
-            # Download the file for each selected submission
-            for quantile_label, submission in quantile_submissions.items():
-                try:
-                    # Create the quantile-specific directory
-                    quantile_dir = os.path.join(DOWNLOAD_DIR, quantile_label)
-                    if not os.path.exists(quantile_dir):
-                        os.makedirs(quantile_dir)
-
-                    attachment = submission.attachments[0]  # Download the first attachment
-                    
-                    # Get the file extension
-                    original_filename = attachment.filename
-                    file_extension = os.path.splitext(original_filename)[1]
-                    
-                    # Calculate percentage score
-                    max_points = assignment.points_possible if hasattr(assignment, 'points_possible') and assignment.points_possible else 100
-                    percent_score = round((submission.score / max_points) * 100, 1) if submission.score and max_points else 0
-
-                    # Create new filename: {assignment_name}_{percent_score}.{extension}
-                    clean_assignment_name = sanitize_filename(assignment.name)
-                    file_name = f"{clean_assignment_name}_{percent_score}{file_extension}"
-                    file_path = os.path.join(quantile_dir, file_name)
-
-                    print(f"  -> Downloading '{file_name}' to {quantile_label} folder...")
-                    attachment.download(file_path)
-                    print(f"     Success! Saved to '{file_path}'")
-
-                    # Download comments for this submission
-                    comment_file_name = f"{clean_assignment_name}_{percent_score}.txt"
-                    comment_file_path = os.path.join(quantile_dir, comment_file_name)
-                    
-                    try:
-                        # Check if submission comments are already included in the submission
-                        if hasattr(submission, 'submission_comments') and submission.submission_comments:
-                            with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
-                                comment_file.write(f"Assignment: {assignment.name}\n")
-                                comment_file.write(f"Student Score: {submission.score}/{max_points} ({percent_score}%)\n")
-                                comment_file.write(f"Submission ID: {submission.id}\n")
-                                comment_file.write("="*50 + "\n\n")
-                                
-                                for i, comment in enumerate(submission.submission_comments, 1):
-                                    comment_file.write(f"Comment {i}:\n")
-                                    comment_file.write(f"Author: {comment.get('author_name', 'Unknown')}\n")
-                                    comment_file.write(f"Date: {comment.get('created_at', 'Unknown')}\n")
-                                    comment_file.write(f"Comment: {comment.get('comment', 'No comment text')}\n")
-                                    comment_file.write("-" * 30 + "\n\n")
-                            
-                            print(f"     Comments saved to '{comment_file_path}'")
-                        else:
-                            # Try to get submission comments through the assignment
-                            try:
-                                comments = assignment.get_submission(submission.id, include=['submission_comments'])
-                                
-                                if hasattr(comments, 'submission_comments') and comments.submission_comments:
-                                    with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
-                                        comment_file.write(f"Assignment: {assignment.name}\n")
-                                        comment_file.write(f"Student Score: {submission.score}/{max_points} ({percent_score}%)\n")
-                                        comment_file.write(f"Submission ID: {submission.id}\n")
-                                        comment_file.write("="*50 + "\n\n")
-                                        
-                                        for i, comment in enumerate(comments.submission_comments, 1):
-                                            comment_file.write(f"Comment {i}:\n")
-                                            comment_file.write(f"Author: {comment.get('author_name', 'Unknown')}\n")
-                                            comment_file.write(f"Date: {comment.get('created_at', 'Unknown')}\n")
-                                            comment_file.write(f"Comment: {comment.get('comment', 'No comment text')}\n")
-                                            comment_file.write("-" * 30 + "\n\n")
-                                    
-                                    print(f"     Comments saved to '{comment_file_path}'")
-                                else:
-                                    # Create empty comment file to maintain consistency
-                                    with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
-                                        comment_file.write(f"Assignment: {assignment.name}\n")
-                                        comment_file.write(f"Student Score: {submission.score}/{max_points} ({percent_score}%)\n")
-                                        comment_file.write(f"Submission ID: {submission.id}\n")
-                                        comment_file.write("="*50 + "\n\n")
-                                        comment_file.write("No comments found for this submission.\n")
-                                    print(f"     No comments found, empty comment file saved to '{comment_file_path}'")
-                            except Exception as comment_error:
-                                # Create empty comment file even if we can't retrieve comments
-                                with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
-                                    comment_file.write(f"Assignment: {assignment.name}\n")
-                                    comment_file.write(f"Student Score: {submission.score}/{max_points} ({percent_score}%)\n")
-                                    comment_file.write(f"Submission ID: {submission.id}\n")
-                                    comment_file.write("="*50 + "\n\n")
-                                    comment_file.write("No comments found for this submission.\n")
-                                print(f"     No comments found, empty comment file saved to '{comment_file_path}'")
-                    
-                    except Exception as comment_error:
-                        # Create empty comment file even if we can't retrieve comments
-                        with open(comment_file_path, 'w', encoding='utf-8') as comment_file:
-                            comment_file.write(f"Assignment: {assignment.name}\n")
-                            comment_file.write(f"Student Score: {submission.score}/{max_points} ({percent_score}%)\n")
-                            comment_file.write(f"Submission ID: {submission.id}\n")
-                            comment_file.write("="*50 + "\n\n")
-                            comment_file.write(f"Error retrieving comments: {comment_error}\n")
-                        print(f"     Warning: Could not retrieve comments for submission {submission.id}: {comment_error}")
-                        print(f"     Created placeholder comment file at '{comment_file_path}'")
-
-                except CanvasException as e:
-                    print(f"     Error: Could not download file for submission ID {submission.id}. Reason: {e}")
-                except IndexError:
-                    print(f"     Error: Submission ID {submission.id} reported attachments but none were found.")
-                except Exception as e:
-                    print(f"     An unexpected error occurred during download: {e}")
+            # Create the base download directory if it doesn't exist
+            if not OUTPUT_ARCHIVE and not os.path.exists(DOWNLOAD_DIR):
+                os.makedirs(DOWNLOAD_DIR)
+                print(f"Created base download directory: '{DOWNLOAD_DIR}'")
 
+        except Unauthorized:
+            print(f"Error: Unauthorized. Please check your API_KEY for Course ID {course_id}.")
+            return
         except ResourceDoesNotExist:
-            print(f"Error: Assignment '{assignment.name}' not found in this course.")
-        except CanvasException as e:
-            print(f"An API error occurred while processing assignment '{assignment.name}': {e}")
+            print(f"Error: Course with ID {course_id} was not found. Please check your COURSE_ID.")
+            return
+        except Exception as e:
+            print(f"An unexpected error occurred while accessing the course: {e}")
+            return
+
+        # Get all assignments for the course
+        try:
+            with tracer.phase("assignment listing"):
+                all_assignments = catalog.assignments
+            print(f"Found {len(all_assignments)} total assignments in the course")
         except Exception as e:
-            print(f"An unexpected error occurred for assignment '{assignment.name}': {e}")
+            print(f"Error retrieving assignments: {e}")
+            return
+
+        # Look the assignments up by name
+        assignments_to_process = []
+        for assignment_name in assignment_names:
+            assignment = all_assignments.get(assignment_name)
+            if assignment is not None:
+                assignments_to_process.append(assignment)
+            else:
+                print(f"Warning: Assignment '{assignment_name}' not found in course")
+
+        if not assignments_to_process:
+            print("Error: No matching assignments found. Please check your assignment names.")
+            return
+
+        print(f"Found {len(assignments_to_process)} assignments to process")
+
+        # Read every assignment's scores concurrently, each on its own worker thread
+        watching = watch_interval is not None
+        columns = [c for c in engine.map(lambda assignment: collect_scores(course, cache, assignment, watching),
+                                         assignments_to_process) if c is not None]
+
+        # Choose the samples of all of them in one vectorized pass
+        with tracer.phase("selection"):
+            selections = select_samples([c for c in columns if len(c) >= len(SUBMISSION_PERCENTILES)],
+                                        SUBMISSION_PERCENTILES, SAMPLES_PER_PERCENTILE, QUANTILE_METHOD)
+
+        print("\n" + "="*50)
+        download_jobs = []
+        for jobs in engine.map(lambda selection: fetch_samples(course, cache, selection), selections):
+            download_jobs.extend(jobs)
+
+    # The run's DOWNLOAD_BUDGET_MB, in bytes, carried through every --watch refresh
+    budget = DOWNLOAD_BUDGET_MB * 1024 * 1024 if DOWNLOAD_BUDGET_MB else None
+
+    # Everything from here on is saved in DOWNLOAD_DIR, or streamed into the archive
+    with archive if archive is not None else nullcontext():
+        if selections and WRITE_DISTRIBUTION_CSV:
+            with output_file(archive, "grade_distribution.csv") as f:
+                write_distribution_csv(selections, f)
+            print(f"Saved the grade distribution of {len(selections)} assignments as 'grade_distribution.csv'")
+
+        if download_jobs:
+            print("\n" + "="*50)
+            budget = download_all(course._requester, download_jobs, DOWNLOAD_WORKERS, archive, budget,
+                                  cache.offline)
+            if EXPORT_COMMENTS_JSONL:
+                with output_file(archive, "sampled_comments.jsonl") as f:
+                    export_comments_jsonl(download_jobs, f)
+                print(f"Exported comments for {len(download_jobs)} samples as 'sampled_comments.jsonl'")
+
+    if watch_interval is not None:
+        print("\n" + "="*50)
+        watch_samples(course, columns, download_jobs, watch_interval, watch_polls, budget)
+
+    if archive is not None:
+        print(f"Wrote {archive.entries} files ({archive.bytes_in / (1024 * 1024):.1f} MB) to '{archive.path}' "
+              f"({os.path.getsize(archive.path) / (1024 * 1024):.1f} MB compressed)")
 
     print("\n" + "="*50)
+    print(f"Listing cache: {cache.hits} hits, {cache.misses} misses ({cache.path})")
+    print(f"Requests: {scheduler.summary()}")
     print("Script finished.")
 
 
@@ -282,6 +1033,27 @@ def main():
     """
     Initializes the Canvas API object and runs the main download logic.
     """
+    parser = argparse.ArgumentParser(description="Download sample submissions at score percentiles.")
+    parser.add_argument("--profile", nargs="?", const="studentwork-trace.json", metavar="TRACE_FILE",
+                        help="record every request and phase, print a per-phase summary and write a "
+                             "Chrome trace to TRACE_FILE (default: %(const)s)")
+    parser.add_argument("--watch", nargs="?", type=float, const=WATCH_INTERVAL, metavar="SECONDS",
+                        help="keep running and refresh the samples as grading goes on, checking every "
+                             "SECONDS (default: %(const)s) until interrupted with Ctrl+C")
+    parser.add_argument("--gc", action="store_true",
+                        help="delete the blobs in BLOB_STORE that no download directory uses any more, and exit")
+    parser.add_argument("--dry-run", action="store_true", help="with --gc, only report what would be deleted")
+    args = parser.parse_args()
+
+    if args.gc:
+        if not BLOB_STORE:
+            print("BLOB_STORE is not set, so there is nothing to collect.")
+            return
+        removed, freed = BlobStore(BLOB_STORE).gc(dry_run=args.dry_run)
+        verb = "Would delete" if args.dry_run else "Deleted"
+        print(f"{verb} {removed} unused blobs ({freed / (1024 * 1024):.1f} MB) from '{BLOB_STORE}'")
+        return
+
     if API_KEY == "YOUR_API_KEY" or COURSE_ID == 0 or not ASSIGNMENT_NAMES:
         print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
         print("!!! PLEASE CONFIGURE THE SCRIPT BEFORE RUNNING              !!!")
@@ -290,10 +1062,12 @@ def main():
         return
 
     try:
-        # Initialize a new Canvas object
-        canvas = Canvas(API_URL, API_KEY)
-        # Verify that the API key is valid
-        canvas.get_current_user()
+        # Initialize a new Canvas object whose requests all go through the
+        # rate-limit-aware scheduler
+        canvas = connect(API_URL, API_KEY)
+        # Verify that the API key is valid, unless we are working from the cache
+        if not OFFLINE:
+            canvas.get_current_user()
     except Unauthorized:
         print("Error: The provided API_KEY is invalid or has expired. Please check your credentials.")
         return
@@ -303,7 +1077,15 @@ def main():
         return
 
     # Run the main process
-    download_submission_examples(canvas, COURSE_ID, ASSIGNMENT_NAMES)
+    if args.profile:
+        tracer.enable()
+    download_submission_examples(canvas, COURSE_ID, ASSIGNMENT_NAMES, watch_interval=args.watch)
+
+    if args.profile:
+        print("\n" + "="*50)
+        tracer.print_summary()
+        tracer.write(args.profile)
+        print(f"Trace written to '{args.profile}' (open it in chrome://tracing or ui.perfetto.dev)")
 
 
 if __name__ == "__main__":